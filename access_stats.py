@@ -0,0 +1,217 @@
+"""Помесячные партиции access_logs, дневные сводки входов и выборка для API.
+
+В MySQL access_logs разбита на партиции по месяцам login_time (pYYYYMM и
+p_future для всего, что позже). maintain_partitions() заранее создаёт
+партиции на months_ahead месяцев вперёд и удаляет целые партиции старше
+срока хранения — без DELETE по сотням миллионов строк. В SQLite партиций
+нет, там старые строки удаляются пачками.
+
+rollup_access_logs() пересчитывает access_log_daily (входы и уникальные
+пользователи за день по тарифам, tariff='*' — все тарифы вместе) только
+для последних дней, поэтому его стоимость не растёт вместе с журналом.
+Статистика для дашбордов читается только из сводки.
+"""
+import logging
+import time
+from datetime import date, datetime, timedelta
+
+from jobs import try_lock, release_lock
+
+logger = logging.getLogger(__name__)
+
+ALL_TARIFFS = '*'
+FUTURE_PARTITION = 'p_future'
+
+
+def _is_sqlite(conn):
+    return getattr(conn, 'dialect', 'mysql') == 'sqlite'
+
+
+def _month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _partition_name(month):
+    return f'p{month:%Y%m}'
+
+
+def maintain_partitions(get_db, months_ahead=2, retention_months=12, batch_size=5000, today=None):
+    """Создание партиций на будущие месяцы и удаление устаревших.
+
+    Возвращает {'created': [...], 'dropped': [...]} (в SQLite — число
+    удалённых строк в 'deleted').
+    """
+    current = _month_start(today or date.today())
+    cutoff = _add_months(current, -retention_months)
+    result = {'created': [], 'dropped': [], 'deleted': 0}
+
+    with get_db() as conn:
+        cursor = conn.cursor()
+        if _is_sqlite(conn):
+            result['deleted'] = _delete_old_rows(conn, cursor, cutoff, batch_size)
+            return result
+
+        if not try_lock(conn, cursor, 'access_log_partitions'):
+            return result
+        try:
+            cursor.execute('''
+                SELECT PARTITION_NAME FROM INFORMATION_SCHEMA.PARTITIONS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'access_logs'
+            ''')
+            names = [row[0] for row in cursor.fetchall() if row[0]]
+            if FUTURE_PARTITION not in names:
+                logger.warning("access_logs is not partitioned, skipping partition maintenance")
+                return result
+            months = sorted(datetime.strptime(name[1:], '%Y%m').date()
+                            for name in names if name != FUTURE_PARTITION)
+
+            # Новые партиции отщепляются от пустой p_future; первая забирает всю историю
+            month = _add_months(months[-1], 1) if months else current
+            while month <= _add_months(current, months_ahead):
+                cursor.execute(f'''
+                    ALTER TABLE access_logs REORGANIZE PARTITION {FUTURE_PARTITION} INTO (
+                        PARTITION {_partition_name(month)} VALUES LESS THAN (TO_DAYS('{_add_months(month, 1)}')),
+                        PARTITION {FUTURE_PARTITION} VALUES LESS THAN MAXVALUE
+                    )
+                ''')
+                result['created'].append(_partition_name(month))
+                months.append(month)
+                month = _add_months(month, 1)
+
+            # Партиция удаляется, только когда весь её месяц старше срока хранения
+            expired = [_partition_name(month) for month in months if _add_months(month, 1) <= cutoff]
+            if expired:
+                cursor.execute(f"ALTER TABLE access_logs DROP PARTITION {', '.join(expired)}")
+                result['dropped'] = expired
+        finally:
+            release_lock(conn, cursor, 'access_log_partitions')
+
+    if result['created'] or result['dropped']:
+        logger.info(f"access_logs partitions maintained: {result}")
+    return result
+
+
+def _delete_old_rows(conn, cursor, cutoff, batch_size):
+    deleted = 0
+    while True:
+        conn.start_transaction()
+        cursor.execute('''
+            DELETE FROM access_logs WHERE id IN (
+                SELECT id FROM access_logs WHERE login_time < %s LIMIT %s
+            )
+        ''', (cutoff.strftime("%Y-%m-%d %H:%M:%S"), batch_size))
+        count = cursor.rowcount
+        conn.commit()
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+
+def rollup_access_logs(get_db, lookback_days=1, max_days=31, today=None):
+    """Инкрементальный пересчёт access_log_daily.
+
+    Пересчитываются дни начиная с последнего уже посчитанного минус
+    lookback_days (записи журнала приходят с задержкой буфера) и до
+    сегодняшнего включительно, не больше max_days за запуск — длинную
+    историю догонят следующие запуски. Возвращает статистику.
+    """
+    start = time.monotonic()
+    today = today or date.today()
+    stats = {'days': 0, 'rows': 0}
+
+    with get_db() as conn:
+        cursor = conn.cursor()
+        if not try_lock(conn, cursor, 'access_log_rollup'):
+            return stats
+        try:
+            cursor.execute('SELECT MAX(day) FROM access_log_daily')
+            last = cursor.fetchone()[0]
+            if last is not None:
+                first = _as_date(last) - timedelta(days=lookback_days)
+            else:
+                cursor.execute('SELECT MIN(login_time) FROM access_logs')
+                oldest = cursor.fetchone()[0]
+                if oldest is None:
+                    return stats
+                first = _as_date(oldest)
+
+            day = first
+            while day <= today and stats['days'] < max_days:
+                stats['rows'] += _rollup_day(conn, cursor, day)
+                stats['days'] += 1
+                day += timedelta(days=1)
+        finally:
+            release_lock(conn, cursor, 'access_log_rollup')
+
+    stats['seconds'] = round(time.monotonic() - start, 3)
+    logger.info(f"Access log rollup: {stats}")
+    return stats
+
+
+def _rollup_day(conn, cursor, day):
+    """Пересчёт одного дня одной транзакцией; возвращает число строк сводки"""
+    params = (
+        day.strftime("%Y-%m-%d"),
+        datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        day.strftime("%Y-%m-%d 00:00:00"),
+        (day + timedelta(days=1)).strftime("%Y-%m-%d 00:00:00"),
+    )
+    conn.start_transaction()
+    cursor.execute('DELETE FROM access_log_daily WHERE day = %s', (params[0],))
+    cursor.execute('''
+        INSERT INTO access_log_daily (day, tariff, logins, unique_users, updated_at)
+        SELECT %s, COALESCE(tariff, ''), COUNT(*), COUNT(DISTINCT user_id), %s
+        FROM access_logs
+        WHERE login_time >= %s AND login_time < %s
+        GROUP BY COALESCE(tariff, '')
+    ''', params)
+    rows = cursor.rowcount
+    cursor.execute(f'''
+        INSERT INTO access_log_daily (day, tariff, logins, unique_users, updated_at)
+        SELECT %s, '{ALL_TARIFFS}', COUNT(*), COUNT(DISTINCT user_id), %s
+        FROM access_logs
+        WHERE login_time >= %s AND login_time < %s
+    ''', params)
+    conn.commit()
+    return rows + 1
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+
+
+def login_stats(get_db, date_from, date_to, tariff=None):
+    """Дневные входы и уникальные пользователи из сводки (без чтения журнала)"""
+    with get_db(readonly=True) as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute('''
+            SELECT day, tariff, logins, unique_users FROM access_log_daily
+            WHERE day >= %s AND day <= %s AND tariff = %s
+            ORDER BY day
+        ''', (date_from.strftime("%Y-%m-%d"), date_to.strftime("%Y-%m-%d"),
+              ALL_TARIFFS if tariff is None else tariff))
+        rows = cursor.fetchall()
+
+    days = [{
+        'day': _as_date(row['day']).isoformat(),
+        'logins': row['logins'],
+        'unique_users': row['unique_users'],
+    } for row in rows]
+    return {
+        'from': date_from.isoformat(),
+        'to': date_to.isoformat(),
+        'tariff': tariff,
+        'days': days,
+        # Уникальные пользователи считаются за день: сумма по дням не равна числу
+        # уникальных за период, поэтому в итогах её нет
+        'totals': {'logins': sum(day['logins'] for day in days)},
+    }
@@ -1,13 +1,40 @@
-import mysql.connector
-from flask import Flask, render_template, request, redirect, session, url_for, jsonify, make_response
+from flask import Flask, render_template, request, redirect, session, url_for, jsonify, make_response, Response, stream_with_context, g, send_file, abort, has_request_context
 from datetime import datetime, timedelta
 import secrets
 import logging
 from functools import wraps
-import jwt
 import os
 import time
+import queue
+import atexit
+import threading
+import random
+import hmac
+import json
+import csv
+import io
+import sys
+import tempfile
+import click
 from dotenv import load_dotenv
+from db_pool import ConnectionPool, PoolTimeout
+from db_router import DatabaseRouter
+import sqlite_store
+from circuit_breaker import CircuitBreaker, DatabaseUnavailable
+from session_cache import SessionCache
+from session_events import SessionWatcher, format_event
+from etags import state_etag, conditional
+from rate_limit import create_rate_limiter
+from jobs import AccessLogWriter, purge_expired_codes
+from migrations import migrate, explain_hot_queries, MIGRATIONS
+from revocation import RevocationList
+from code_issuer import issue_codes, validate_prefix, MAX_VALID_DAYS
+from session_admin import bulk_update_sessions, ACTIONS as SESSION_ACTIONS
+from access_stats import maintain_partitions, rollup_access_logs, login_stats
+from assets import AssetManifest, DIST_DIR, STATIC_DIR, choose_encoding, guess_type
+import assets
+from metrics import (registry, InstrumentedCursor, new_request_stats, request_stats,
+                     observe_request_stat, server_timing)
 
 # Загружаем переменные окружения из .env файла
 load_dotenv()
@@ -28,23 +55,27 @@ app.permanent_session_lifetime = timedelta(days=1)
 app.config['SESSION_REFRESH_EACH_REQUEST'] = False  # Важно: отключаем автообновление
 app.config['SESSION_REFRESH_INTERVAL'] = 300  # Интервал обновления 5 минут
 
-# Добавляем защиту от частых запросов
-last_session_check = {}
+# Добавляем защиту от частых запросов (минимум 30 секунд между проверками).
+# RATE_LIMIT_BACKEND=sqlite делает лимит общим для всех воркеров узла.
+session_check_limiter = create_rate_limiter(
+    30,
+    backend=os.environ.get('RATE_LIMIT_BACKEND', 'memory'),
+    path=os.environ.get('RATE_LIMIT_DB')
+)
 
 def can_check_session(user_id):
     """Ограничиваем частоту проверки сессии"""
-    now = datetime.now()
-    if user_id in last_session_check:
-        time_diff = (now - last_session_check[user_id]).total_seconds()
-        if time_diff < 30:  # Минимум 30 секунд между проверками
-            return False
-    last_session_check[user_id] = now
-    return True
+    return session_check_limiter.allow(user_id)
 
 # JWT Configuration
 JWT_SECRET = os.environ.get('JWT_SECRET_KEY')  # Получаем из переменной окружения
 JWT_ALGORITHM = 'HS256'
 JWT_EXPIRATION = timedelta(days=1)
+# Быстрый путь: в течение JWT_REVALIDATE_AFTER секунд после выдачи токен
+# принимается без обращения к БД (с проверкой по набору отозванных сессий)
+JWT_FAST_PATH = os.environ.get('JWT_FAST_PATH', '0') == '1'
+JWT_REVALIDATE_AFTER = int(os.environ.get('JWT_REVALIDATE_AFTER', 60))
+JWT_REVOCATION_REFRESH = int(os.environ.get('JWT_REVOCATION_REFRESH', 5))
 
 # Database Configuration
 MYSQL_CONFIG = {
@@ -52,88 +83,653 @@ MYSQL_CONFIG = {
     'user': os.environ.get('DB_USER', 'zhantik31'),
     'password': os.environ.get('DB_PASSWORD', 'randome21'),
     'database': os.environ.get('DB_NAME', 'access_data'),
-    'connect_timeout': 30,  # Увеличиваем таймаут подключения
-    'connection_timeout': 30,
+    'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 10)),
+    'connection_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 10)),
     'compress': True,  # Сжатие данных для медленных соединений
     'buffered': True  # Буферизация для улучшения производительности
 }
 
-def get_db():
-    """Установка соединения с базой данных"""
-    retries = 5  # вместо текущих 3
+# Доля запросов, для которых пишутся отладочные логи горячего пути
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 0.01))
+# Заголовок Server-Timing с временем БД в ответах
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') == '1'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+# Общий каталог снимков метрик воркеров: без него /metrics показывает только
+# тот воркер, в который попал scrape (см. metrics.Registry)
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_DUMP_INTERVAL = int(os.environ.get('METRICS_DUMP_INTERVAL', 5))
+registry.directory = METRICS_DIR
+# Токен для административных эндпоинтов (Telegram-бот); без него они отключены
+ADMIN_API_TOKEN = os.environ.get('ADMIN_API_TOKEN')
+MAX_BULK_CODES = int(os.environ.get('MAX_BULK_CODES', 100000))
+MAX_BULK_USERS = int(os.environ.get('MAX_BULK_USERS', 100000))
+
+def log_sampled(message, *args):
+    """Отладочный лог горячего пути: пишется только для доли запросов"""
+    if logger.isEnabledFor(logging.DEBUG) and random.random() < LOG_SAMPLE_RATE:
+        logger.debug(message, *args)
+
+# Хранилище: mysql (по умолчанию) или встроенный sqlite для одиночных узлов
+DB_BACKEND = os.environ.get('DB_BACKEND', 'mysql')
+SQLITE_PATH = os.environ.get('SQLITE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'access_data.sqlite3'))
+# Периодическая подгрузка кодов из MySQL в SQLite (0 — только вручную: flask sync-sqlite)
+SQLITE_SYNC_INTERVAL = int(os.environ.get('SQLITE_SYNC_INTERVAL', 0))
+
+# Реплики для чтения: DB_REPLICA_HOSTS="host1,host2:3307" (учётные данные — как у primary)
+DB_REPLICA_HOSTS = [host.strip() for host in os.environ.get('DB_REPLICA_HOSTS', '').split(',') if host.strip()]
+DB_REPLICA_MAX_LAG = int(os.environ.get('DB_REPLICA_MAX_LAG', 5))
+DB_REPLICA_CHECK_INTERVAL = int(os.environ.get('DB_REPLICA_CHECK_INTERVAL', 5))
+# Сколько секунд после входа чтения пользователя идут на primary
+DB_PRIMARY_PIN_SECONDS = int(os.environ.get('DB_PRIMARY_PIN_SECONDS', 10))
+# Недоступная реплика не должна задерживать чтение дольше этого таймаута
+DB_REPLICA_CONNECT_TIMEOUT = int(os.environ.get('DB_REPLICA_CONNECT_TIMEOUT', 2))
+
+def _replica_config(host):
+    """Настройки подключения к реплике (host или host:port)"""
+    config = dict(MYSQL_CONFIG)
+    name, _, port = host.partition(':')
+    config['host'] = name
+    if port:
+        config['port'] = int(port)
+    config['user'] = os.environ.get('DB_REPLICA_USER', config['user'])
+    config['password'] = os.environ.get('DB_REPLICA_PASSWORD', config['password'])
+    config['connect_timeout'] = config['connection_timeout'] = DB_REPLICA_CONNECT_TIMEOUT
+    return config
+
+# Автомат защиты primary: после серии ошибок запросы сразу получают 503,
+# восстановление проверяется фоновой задачей
+db_breaker = CircuitBreaker(
+    failure_threshold=int(os.environ.get('DB_BREAKER_FAILURES', 5)),
+    window=int(os.environ.get('DB_BREAKER_WINDOW', 30)),
+    open_seconds=int(os.environ.get('DB_BREAKER_OPEN_SECONDS', 15))
+)
+DB_PROBE_TIMEOUT = int(os.environ.get('DB_PROBE_TIMEOUT', 3))
+
+def _connect(config=None, breaker=None, retries=None):
+    """Установка нового соединения с базой данных (handshake)"""
+    import mysql.connector
+    config = config or MYSQL_CONFIG
+    # В потоке запроса не ждём повторов с паузами: при сбое лучше быстрый отказ
+    if retries is None:
+        retries = 1 if has_request_context() else 5
     delay = 1  # начальная задержка в секундах
     
     for attempt in range(retries):
         try:
-            logger.info(f"Attempting to connect to database at {MYSQL_CONFIG['host']} (attempt {attempt + 1}/{retries})")
-            conn = mysql.connector.connect(**MYSQL_CONFIG)
+            logger.debug("Attempting to connect to database at %s (attempt %d/%d)", config['host'], attempt + 1, retries)
+            start = time.perf_counter()
+            conn = mysql.connector.connect(**config)
             conn.autocommit = True
-            logger.info("Database connection successful")
+            elapsed = time.perf_counter() - start
+            registry.observe('db_connect_seconds', elapsed)
+            observe_request_stat('connect', elapsed)
+            logger.debug("Database connection successful")
             return conn
         except mysql.connector.Error as e:
             logger.error(f"Database connection error (attempt {attempt + 1}/{retries}): {str(e)}")
+            if breaker is not None:
+                breaker.record_failure()
+                if breaker.state == breaker.OPEN:
+                    raise DatabaseUnavailable(str(e)) from e
             if attempt < retries - 1:
+                registry.inc('db_connect_retries_total')
                 logger.info(f"Retrying in {delay} seconds...")
                 time.sleep(delay)
                 delay *= 2  # увеличиваем задержку экспоненциально
             else:
                 raise
 
-def init_db():
-    """Инициализация базы данных"""
+def _on_db_error(exc):
+    """Обрыв соединения или таймаут посреди запроса — ошибка для автомата защиты"""
+    import mysql.connector
+    if isinstance(exc, (mysql.connector.OperationalError, mysql.connector.InterfaceError)):
+        db_breaker.record_failure()
+
+def _probe_db():
+    """Проверка восстановления primary: одно соединение с коротким таймаутом"""
+    import mysql.connector
+    conn = mysql.connector.connect(**dict(MYSQL_CONFIG, connect_timeout=DB_PROBE_TIMEOUT,
+                                          connection_timeout=DB_PROBE_TIMEOUT))
+    try:
+        conn.ping()
+    finally:
+        conn.close()
+
+def _create_pool(config=None, breaker=None, retries=None):
+    """Пул соединений (свой в каждом воркере)"""
+    if DB_BACKEND == 'sqlite':
+        connect = lambda: sqlite_store.connect(SQLITE_PATH)
+    else:
+        connect = lambda: _connect(config, breaker, retries)
+    return ConnectionPool(
+        connect,
+        size=int(os.environ.get('DB_POOL_SIZE', 5)),
+        max_lifetime=int(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+        ping_interval=int(os.environ.get('DB_POOL_PING_INTERVAL', 30)),
+        timeout=int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        cursor_wrapper=InstrumentedCursor,
+        on_error=_on_db_error if breaker is not None else None
+    )
+
+# Автомат защиты и реплики имеют смысл только для сетевой MySQL
+db_pool = _create_pool(breaker=db_breaker if DB_BACKEND == 'mysql' else None)
+db_router = DatabaseRouter(
+    db_pool,
+    # Без повторов с паузами: при сбое реплики чтение сразу уходит на primary
+    [(host, _create_pool(_replica_config(host), retries=1)) for host in DB_REPLICA_HOSTS if DB_BACKEND == 'mysql'],
+    max_lag=DB_REPLICA_MAX_LAG,
+    pin_seconds=DB_PRIMARY_PIN_SECONDS
+)
+
+def get_db(readonly=False, user_id=None):
+    """Получение соединения из пула (возвращается в пул при выходе из with).
+
+    readonly=True — запрос только читает и может уйти на реплику; user_id
+    нужен, чтобы сразу после входа чтения пользователя шли на primary.
+    """
+    target, pool = db_router.choose(readonly, user_id)
+    if target != 'primary':
+        try:
+            return _acquire(target, pool, readonly)
+        except Exception as e:
+            _replica_failed(target, e)
+            target, pool = 'primary', db_router.primary
+    return _acquire(target, pool, readonly)
+
+def _acquire(target, pool, readonly):
+    if target == 'primary':
+        db_breaker.check()
+    start = time.perf_counter()
+    conn = pool.acquire()
+    elapsed = time.perf_counter() - start
+    registry.observe('db_pool_wait_seconds', elapsed)
+    observe_request_stat('pool_wait', elapsed)
+    if readonly:
+        registry.inc('db_reads_total', target='primary' if target == 'primary' else 'replica')
+    return conn
+
+def _replica_failed(name, exc):
+    """Ошибка реплики: чтение повторяется на primary, реплика ждёт проверки здоровья"""
+    logger.warning(f"Replica {name} read failed, falling back to primary: {str(exc)}")
+    db_router.mark_unhealthy(name)
+
+def fetch_session_row(query, params, user_id, dictionary=False):
+    """Чтение строки сессии с реплики; пустой ответ или ошибка реплики —
+    повтор на primary.
+
+    Реплика может ещё не получить свежий вход (в том числе выполненный другим
+    воркером), поэтому «сессии нет» окончательно решает только primary.
+    """
+    target, pool = db_router.choose(readonly=True, user_id=user_id)
+    if target != 'primary':
+        try:
+            with _acquire(target, pool, readonly=True) as conn:
+                cursor = conn.cursor(dictionary=dictionary)
+                cursor.execute(query, params)
+                row = cursor.fetchone()
+            if row:
+                return row
+        except Exception as e:
+            _replica_failed(target, e)
+    with _acquire('primary', db_router.primary, readonly=True) as conn:
+        cursor = conn.cursor(dictionary=dictionary)
+        cursor.execute(query, params)
+        return cursor.fetchone()
+
+# Кэш активных сессий (сбрасывается при каждой записи приложения в codes)
+session_cache = SessionCache(
+    max_entries=int(os.environ.get('SESSION_CACHE_SIZE', 10000)),
+    ttl=int(os.environ.get('SESSION_CACHE_TTL', 30)),
+    # Сколько ещё сессия из кэша принимается, пока БД недоступна (не дольше expires_at)
+    stale_ttl=int(os.environ.get('SESSION_STALE_TTL', 900))
+)
+
+def get_active_session(user_id, session_id):
+    """Срок действия активной сессии или None, если сессия не активна"""
+    expires_at = session_cache.get(user_id, session_id)
+    if expires_at is not None:
+        return expires_at
+
+    import mysql.connector
+    try:
+        row = fetch_session_row('''
+            SELECT expires_at FROM codes 
+            WHERE user_id = %s AND session_id = %s AND is_used = 1 AND expires_at > %s
+        ''', (user_id, session_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S")), user_id)
+    except (DatabaseUnavailable, PoolTimeout, mysql.connector.Error) as e:
+        # БД недоступна — последнее подтверждённое состояние из кэша
+        expires_at = session_cache.get(user_id, session_id, allow_stale=True)
+        if expires_at is None:
+            if isinstance(e, DatabaseUnavailable):
+                raise
+            raise DatabaseUnavailable(str(e)) from e
+        registry.inc('session_stale_served_total')
+        return expires_at
+
+    if not row:
+        return None
+    session_cache.set(user_id, session_id, row[0])
+    return row[0]
+
+# Отозванные сессии для быстрого пути JWT
+revocation_list = RevocationList(
+    get_db,
+    retention=JWT_REVALIDATE_AFTER * 2,
+    max_staleness=JWT_REVOCATION_REFRESH * 3
+)
+
+# Единый наблюдатель за сессиями для server-push (/api/session_events)
+session_watcher = SessionWatcher(
+    get_db,
+    interval=int(os.environ.get('SESSION_WATCH_INTERVAL', 5)),
+    on_change=session_cache.invalidate
+)
+# Поток SSE держит воркер до SSE_MAX_STREAM секунд: включать только с
+# потоковыми или асинхронными воркерами (gunicorn -k gthread/gevent),
+# иначе дашборд опрашивает сервер условными запросами
+SSE_ENABLED = os.environ.get('SSE_ENABLED', '0') == '1'
+app.jinja_env.globals['sse_enabled'] = SSE_ENABLED
+SSE_HEARTBEAT = 25  # Комментарий-пинг, чтобы прокси не закрывали соединение
+SSE_MAX_STREAM = int(os.environ.get('SSE_MAX_STREAM', 300))  # Потом клиент переподключается
+
+# Фоновые задачи: сброс access_logs и очистка просроченных кодов
+ACCESS_LOG_FLUSH_INTERVAL = int(os.environ.get('ACCESS_LOG_FLUSH_INTERVAL', 10))
+CODES_SWEEP_INTERVAL = int(os.environ.get('CODES_SWEEP_INTERVAL', 600))
+CODES_SWEEP_BATCH = int(os.environ.get('CODES_SWEEP_BATCH', 1000))
+CODES_ARCHIVE = os.environ.get('CODES_ARCHIVE', '0') == '1'
+# Дневные сводки access_logs и помесячные партиции (access_stats.py)
+ACCESS_ROLLUP_INTERVAL = int(os.environ.get('ACCESS_ROLLUP_INTERVAL', 300))
+ACCESS_LOG_RETENTION_MONTHS = int(os.environ.get('ACCESS_LOG_RETENTION_MONTHS', 12))
+ACCESS_LOG_PARTITIONS_AHEAD = int(os.environ.get('ACCESS_LOG_PARTITIONS_AHEAD', 2))
+MAX_STATS_DAYS = 366
+
+scheduler = None
+_scheduler_pid = None
+_scheduler_lock = threading.Lock()
+
+def _flush_access_logs_now():
+    """Внеочередной сброс буфера логов в потоке планировщика"""
+    if scheduler is not None:
+        scheduler.add_job(access_log_writer.flush, id='access_logs_flush_now', replace_existing=True)
+
+access_log_writer = AccessLogWriter(
+    get_db,
+    batch_size=int(os.environ.get('ACCESS_LOG_BATCH', 200)),
+    on_full=_flush_access_logs_now
+)
+
+def start_scheduler():
+    """Запуск фоновых задач (один раз в каждом процессе-воркере)"""
+    global scheduler, _scheduler_pid
+    with _scheduler_lock:
+        if _scheduler_pid == os.getpid():
+            return
+        _scheduler_pid = os.getpid()
+
+        from apscheduler.schedulers.background import BackgroundScheduler
+        scheduler = BackgroundScheduler(daemon=True)
+        scheduler.add_job(access_log_writer.flush, 'interval', seconds=ACCESS_LOG_FLUSH_INTERVAL,
+                          id='access_logs_flush', coalesce=True, max_instances=1)
+        if JWT_FAST_PATH:
+            scheduler.add_job(revocation_list.refresh, 'interval', seconds=JWT_REVOCATION_REFRESH,
+                              id='revocation_refresh', coalesce=True, max_instances=1,
+                              next_run_time=datetime.now())
+        # Отзывы пишутся и без быстрого пути (массовый отзыв), чистим всегда
+        scheduler.add_job(revocation_list.prune, 'interval', hours=1,
+                          id='revocation_prune', coalesce=True, max_instances=1)
+        if db_router.replicas:
+            scheduler.add_job(db_router.check_replicas, 'interval', seconds=DB_REPLICA_CHECK_INTERVAL,
+                              id='replica_health', coalesce=True, max_instances=1,
+                              next_run_time=datetime.now())
+        if DB_BACKEND == 'sqlite' and SQLITE_SYNC_INTERVAL:
+            scheduler.add_job(sync_sqlite, 'interval', seconds=SQLITE_SYNC_INTERVAL,
+                              id='sqlite_sync', coalesce=True, max_instances=1)
+        scheduler.add_job(db_breaker.probe, 'interval', seconds=int(os.environ.get('DB_PROBE_INTERVAL', 5)),
+                          args=[_probe_db], id='db_probe', coalesce=True, max_instances=1)
+        if os.environ.get('CODES_SWEEPER', '1') == '1':
+            scheduler.add_job(purge_expired_codes, 'interval', seconds=CODES_SWEEP_INTERVAL,
+                              args=[get_db], kwargs={'batch_size': CODES_SWEEP_BATCH, 'archive': CODES_ARCHIVE},
+                              id='purge_expired_codes', coalesce=True, max_instances=1)
+        if os.environ.get('ACCESS_STATS', '1') == '1':
+            scheduler.add_job(rollup_access_logs, 'interval', seconds=ACCESS_ROLLUP_INTERVAL,
+                              args=[get_db], id='access_logs_rollup', coalesce=True, max_instances=1)
+            scheduler.add_job(maintain_partitions, 'interval', hours=24, args=[get_db],
+                              kwargs={'months_ahead': ACCESS_LOG_PARTITIONS_AHEAD,
+                                      'retention_months': ACCESS_LOG_RETENTION_MONTHS},
+                              id='access_logs_partitions', coalesce=True, max_instances=1,
+                              next_run_time=datetime.now())
+        if METRICS_DIR:
+            scheduler.add_job(registry.dump, 'interval', seconds=METRICS_DUMP_INTERVAL,
+                              id='metrics_dump', coalesce=True, max_instances=1,
+                              next_run_time=datetime.now())
+            atexit.register(registry.dump)
+        scheduler.start()
+        atexit.register(access_log_writer.flush)
+
+@app.before_request
+def ensure_background_jobs():
+    start_scheduler()
+
+@app.before_request
+def start_request_stats():
+    new_request_stats()
+
+@app.after_request
+def record_request_stats(response):
+    stats = request_stats.get()
+    if stats is not None:
+        registry.observe('http_request_seconds', time.perf_counter() - stats['start'],
+                         endpoint=request.endpoint or 'unknown')
+        if SERVER_TIMING:
+            response.headers['Server-Timing'] = server_timing(stats)
+    return response
+
+def _collect_runtime_metrics():
+    """Текущее состояние пула, кэша и фоновых компонентов"""
+    pool = db_pool.stats()
+    return {
+        'db_pool_size': pool['size'],
+        'db_pool_borrowed': pool['borrowed'],
+        'db_pool_idle': pool['idle'],
+        'db_pool_borrows_total': pool['borrows'],
+        'db_pool_handshakes_total': pool['handshakes'],
+        'db_pool_discarded_total': pool['discarded'],
+        'session_cache_entries': len(session_cache),
+        'session_cache_hits_total': session_cache.hits,
+        'session_cache_misses_total': session_cache.misses,
+        'session_cache_stale_hits_total': session_cache.stale_hits,
+        'db_circuit_open': int(db_breaker.state == db_breaker.OPEN),
+        'db_circuit_opened_total': db_breaker.times_opened,
+        'db_circuit_rejected_total': db_breaker.rejected,
+        'session_watcher_subscribers': session_watcher.subscriber_count(),
+        'access_log_rows_written_total': access_log_writer.rows_written,
+        'access_log_dropped_total': access_log_writer.dropped,
+        'db_replicas_healthy': sum(1 for replica in db_router.replicas if replica.healthy),
+    }
+
+registry.add_collector(_collect_runtime_metrics)
+
+@app.errorhandler(DatabaseUnavailable)
+def database_unavailable(e):
+    """Быстрый отказ при недоступной БД (вместо ожидания таймаутов)"""
+    response = jsonify({"error": "Сервис временно недоступен"})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(db_breaker.open_seconds)
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Метрики в формате Prometheus (с METRICS_DIR — суммарно по всем воркерам)"""
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return jsonify({"error": "Требуется авторизация"}), 401
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+# Хэшированная статика (см. assets.py); без сборки — обычные /static/ URL
+asset_manifest = AssetManifest()
+app.jinja_env.globals['asset_url'] = asset_manifest.url
+ASSET_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+@app.route('/assets/<path:filename>')
+def hashed_asset(filename):
+    """Хэшированные файлы: вечное кэширование и предсжатые варианты"""
+    if not asset_manifest.is_known(filename):
+        abort(404)
+    path, encoding = choose_encoding(request.headers.get('Accept-Encoding'), os.path.join(DIST_DIR, filename))
+    response = send_file(path, mimetype=guess_type(filename), etag=False, conditional=False)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = ASSET_CACHE_CONTROL
+    return response
+
+@app.route('/static/sw.js', endpoint='service_worker', defaults={'filename': 'sw.js'})
+@app.route('/static/service-worker.js', endpoint='service_worker_legacy', defaults={'filename': 'service-worker.js'})
+def service_worker(filename):
+    """Сервис-воркер со списком хэшированных файлов из последней сборки"""
+    built = os.path.join(DIST_DIR, filename)
+    path = built if os.path.exists(built) else os.path.join(STATIC_DIR, filename)
+    response = send_file(path, mimetype='application/javascript')
+    # Сам сервис-воркер всегда перепроверяется, иначе браузер не увидит новую сборку
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Сборка хэшированной и предсжатой статики в static/dist"""
+    manifest = assets.build()
+    asset_manifest.load()
+    print(f"Собрано файлов: {len(manifest['files'])} (сборка {manifest['build']})")
+
+def client_ip():
+    """IP клиента с учётом прокси"""
+    forwarded = request.headers.get('X-Forwarded-For')
+    if forwarded:
+        return forwarded.split(',')[0].strip()
+    return request.remote_addr
+
+def init_db(conn=None):
+    """Инициализация базы данных (применение миграций схемы)"""
+    if conn is not None:
+        applied = migrate(conn)
+    else:
+        with get_db() as conn:
+            applied = migrate(conn)
+    if applied:
+        logger.info(f"Applied migrations: {applied}")
+    return applied
+
+# Проверка схемы при старте: once — один раз на деплой (версия схемы
+# запоминается в SCHEMA_STAMP), always — в каждом процессе, off — только init-db
+SCHEMA_CHECK = os.environ.get('SCHEMA_CHECK', 'once')
+SCHEMA_STAMP = os.environ.get('SCHEMA_STAMP', os.path.join(tempfile.gettempdir(), 'access_data.schema'))
+# Сколько соединений открыть заранее в каждом воркере (0 — по первому запросу)
+DB_PREWARM = int(os.environ.get('DB_PREWARM', 0))
+
+def _schema_stamp():
+    """База и последняя известная версия схемы — меняется с новым деплоем миграций"""
+    target = SQLITE_PATH if DB_BACKEND == 'sqlite' else f"{MYSQL_CONFIG['host']}/{MYSQL_CONFIG['database']}"
+    return f"{DB_BACKEND}:{target}:{MIGRATIONS[-1][0]}"
+
+def _schema_connection():
+    """Отдельное соединение для проверки схемы при старте: одна попытка с
+    коротким таймаутом, без пауз между повторами и без учёта в db_breaker —
+    недоступная БД не должна задерживать загрузку воркера и не должна
+    оставлять автомат разомкнутым в мастере перед fork"""
+    if DB_BACKEND == 'sqlite':
+        return sqlite_store.connect(SQLITE_PATH)
+    _probe_db()
+    return _connect(MYSQL_CONFIG, retries=1)
+
+def ensure_schema():
+    """Миграции при старте, но не чаще одного раза на деплой (см. SCHEMA_CHECK)"""
+    if SCHEMA_CHECK == 'off':
+        return None
+    stamp = _schema_stamp()
+    if SCHEMA_CHECK == 'once':
+        try:
+            with open(SCHEMA_STAMP) as f:
+                if f.read() == stamp:
+                    return None
+        except OSError:
+            pass
+    try:
+        conn = _schema_connection()
+        try:
+            applied = init_db(conn)
+        finally:
+            conn.close()
+    except Exception as e:
+        # Без БД воркеры всё равно должны подняться (страница входа, 503 вместо таймаутов)
+        logger.error(f"Schema check failed: {str(e)}")
+        return None
+    try:
+        with open(SCHEMA_STAMP, 'w') as f:
+            f.write(stamp)
+    except OSError as e:
+        logger.warning(f"Could not write schema stamp: {str(e)}")
+    return applied
+
+def prewarm_db(count=None):
+    """Открытие соединений заранее (в фоне, чтобы не задерживать старт воркера)"""
+    count = DB_PREWARM if count is None else count
+    if count <= 0:
+        return None
+
+    def warm():
+        try:
+            opened = db_pool.prewarm(count)
+            logger.info(f"Prewarmed {opened} database connections in worker {os.getpid()}")
+        except Exception as e:
+            logger.warning(f"Database prewarm failed: {str(e)}")
+
+    thread = threading.Thread(target=warm, name='db-prewarm', daemon=True)
+    thread.start()
+    return thread
+
+_app_created = False
+
+def create_app(preload=False):
+    """Фабрика приложения для gunicorn.
+
+        gunicorn 'app:create_app(preload=True)' --preload -w 4
+
+    Схема проверяется один раз (в мастере при --preload), после чего мастер
+    закрывает свои соединения: воркеры после fork открывают собственные
+    (пулы и так не используют сокеты родителя). С DB_PREWARM воркер
+    открывает соединения сразу после старта, а не на первом запросе.
+    """
+    global _app_created
+    if _app_created:
+        return app
+    _app_created = True
+
+    ensure_schema()
+    db_pool.close_all()
+    if preload:
+        # Тяжёлые модули импортируются один раз в мастере, воркеры получают их готовыми
+        import jwt  # noqa: F401
+        import apscheduler.schedulers.background  # noqa: F401
+        if DB_BACKEND == 'mysql':
+            import mysql.connector  # noqa: F401
+        # Снимки метрик прошлого запуска: счётчики новых воркеров начинаются с нуля
+        registry.clear_directory()
+        os.register_at_fork(after_in_child=prewarm_db)
+    else:
+        prewarm_db()
+    return app
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Применение миграций схемы"""
+    applied = init_db()
+    print(f"Применены миграции: {applied}" if applied else "Схема актуальна")
+
+@app.cli.command('check-queries')
+@click.option('--min-rows', default=1000, help='с какого размера таблицы полный скан — ошибка при любом плане')
+def check_queries_command(min_rows):
+    """Проверка планов горячих запросов через EXPLAIN"""
+    if DB_BACKEND != 'mysql':
+        raise click.ClickException('Проверка планов поддерживается только для MySQL')
     with get_db() as conn:
-        cursor = conn.cursor()
-        # Таблица кодов доступа
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS codes (
-                id INTEGER PRIMARY KEY AUTO_INCREMENT,
-                user_id INTEGER NOT NULL,
-                code VARCHAR(255) UNIQUE NOT NULL,
-                expires_at DATETIME NOT NULL,
-                tariff VARCHAR(255),
-                is_used BOOLEAN DEFAULT FALSE,
-                session_id VARCHAR(255),
-                needs_refresh BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Таблица логов доступа
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS access_logs (
-                id INTEGER PRIMARY KEY AUTO_INCREMENT,
-                user_id INTEGER NOT NULL,
-                code VARCHAR(255) NOT NULL,
-                ip_address VARCHAR(255) NOT NULL,
-                user_agent TEXT,
-                login_time DATETIME NOT NULL,
-                logout_time DATETIME,
-                session_id VARCHAR(255)
-            )
-        ''')
-        
-        # Таблица пользователей (добавлена для будущего расширения)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTO_INCREMENT,
-                telegram_id INTEGER UNIQUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        conn.commit()
+        report = explain_hot_queries(conn, min_rows=min_rows)
+    for row in report:
+        mark = 'FULL SCAN' if row['full_scan'] else 'UNVERIFIED (small table)' if row['unverified'] else 'ok'
+        print(f"{row['query']:<22} {str(row['table']):<12} type={row['type']} key={row['key']} rows={row['rows']} {mark}")
+    if any(row['unverified'] for row in report):
+        print(f"Планы на таблицах меньше {min_rows} строк не доказывают использование индекса: "
+              f"повторите проверку на базе с данными объёма продакшена")
+    if any(row['full_scan'] for row in report):
+        raise SystemExit(1)
 
-def create_jwt_token(user_id):
+def sync_sqlite(path=None):
+    """Подгрузка codes и users из MySQL в локальную SQLite"""
+    target = sqlite_store.connect(path or SQLITE_PATH)
+    try:
+        migrate(target)
+        source = _connect(MYSQL_CONFIG)
+        try:
+            stats = sqlite_store.sync_from_mysql(source, target)
+        finally:
+            source.close()
+    finally:
+        target.close()
+    session_cache.clear()
+    return stats
+
+@app.cli.command('sync-sqlite')
+@click.option('--path', default=None, help='файл SQLite (по умолчанию SQLITE_PATH)')
+def sync_sqlite_command(path):
+    """Загрузка кодов из MySQL во встроенную SQLite"""
+    stats = sync_sqlite(path)
+    print(f"Загружено кодов: {stats['codes']}, пользователей: {stats['users']} за {stats['seconds']} с")
+
+@app.cli.command('rollup-access-logs')
+@click.option('--max-days', default=31, help='сколько дней пересчитать за запуск')
+def rollup_access_logs_command(max_days):
+    """Партиции access_logs и пересчёт дневной сводки входов"""
+    result = maintain_partitions(get_db, months_ahead=ACCESS_LOG_PARTITIONS_AHEAD,
+                                 retention_months=ACCESS_LOG_RETENTION_MONTHS)
+    print(f"Партиции: создано {result['created']}, удалено {result['dropped']}, строк удалено {result['deleted']}")
+    stats = rollup_access_logs(get_db, max_days=max_days)
+    print(f"Сводка: дней {stats['days']}, строк {stats['rows']}")
+
+def _format_issued(rows, fmt):
+    """Строки выпущенных кодов в NDJSON или CSV"""
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue()
+    return ''.join(json.dumps({'user_id': user_id, 'code': code}) + '\n' for user_id, code in rows)
+
+@app.cli.command('issue-codes')
+@click.option('--count', type=int, help='Сколько кодов выпустить для --user-id')
+@click.option('--user-id', type=int, default=0, help='Владелец кодов при --count')
+@click.option('--user-ids-file', type=click.File('r'), help='Файл с user_id, по одному на строку')
+@click.option('--valid-days', type=click.IntRange(1, MAX_VALID_DAYS), default=30, help='Срок действия кодов в днях')
+@click.option('--tariff', default=None)
+@click.option('--prefix', default='', help='Префикс кода (например, для акции)')
+@click.option('--chunk-size', type=click.IntRange(1, 5000), default=1000)
+@click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']), default='csv')
+def issue_codes_command(count, user_id, user_ids_file, valid_days, tariff, prefix, chunk_size, fmt):
+    """Массовый выпуск кодов доступа (вывод в stdout)"""
+    if user_ids_file:
+        user_ids = [int(line) for line in user_ids_file if line.strip()]
+    elif count:
+        user_ids = [user_id] * count
+    else:
+        raise click.UsageError('Нужен --count или --user-ids-file')
+    try:
+        validate_prefix(prefix)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--prefix')
+
+    stats = {}
+    expires_at = datetime.now() + timedelta(days=valid_days)
+    for rows in issue_codes(get_db, user_ids, expires_at, tariff, chunk_size, prefix=prefix, stats=stats):
+        sys.stdout.write(_format_issued(rows, fmt))
+    click.echo(f"Выпущено {stats['issued']} кодов за {stats['seconds']} с "
+               f"({stats['codes_per_second']} кодов/с)", err=True)
+
+def create_jwt_token(user_id, session_id=None, expires_at=None):
     """Генерация JWT токена"""
+    import jwt
+    now = datetime.utcnow()
     payload = {
         'user_id': user_id,
-        'exp': datetime.utcnow() + JWT_EXPIRATION,
-        'session_id': secrets.token_hex(16),
-        'iss': 'auth-service'
+        'exp': now + JWT_EXPIRATION,
+        'session_id': session_id or secrets.token_hex(16),
+        'iss': 'auth-service',
+        'rva': int(time.time()) + JWT_REVALIDATE_AFTER  # revalidate-after
     }
+    if expires_at is not None:
+        # Срок действия кода (expires_at хранится в локальном времени)
+        payload['code_exp'] = int(expires_at.timestamp())
+        payload['exp'] = min(payload['exp'], now + (expires_at - datetime.now()))
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 def verify_jwt_token(token):
     """Проверка JWT токена"""
+    import jwt
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
         return payload
@@ -142,6 +738,40 @@ def verify_jwt_token(token):
     except jwt.InvalidTokenError:
         return None
 
+def is_token_session_active(payload):
+    """Проверка сессии из JWT: без БД, пока токен в окне revalidate-after"""
+    if JWT_FAST_PATH and revocation_list.is_fresh():
+        if revocation_list.is_revoked(payload.get('session_id')):
+            return False
+        now = time.time()
+        if now < payload.get('rva', 0) and now < payload.get('code_exp', 0):
+            return True
+
+    expires_at = get_active_session(payload['user_id'], payload.get('session_id'))
+    if expires_at and JWT_FAST_PATH and db_breaker.state == db_breaker.CLOSED:
+        # Окно истекло, сессия подтверждена БД — выдаём токен с новым окном
+        g.refreshed_token = create_jwt_token(payload['user_id'], payload.get('session_id'), expires_at)
+    return bool(expires_at)
+
+@app.after_request
+def attach_refreshed_token(response):
+    token = g.pop('refreshed_token', None)
+    if token:
+        response.headers['X-Refresh-Token'] = token
+    return response
+
+def admin_required(f):
+    """Доступ только по ADMIN_API_TOKEN (для Telegram-бота и служебных задач)"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not ADMIN_API_TOKEN:
+            return jsonify({"error": "Административный API отключён"}), 403
+        auth_header = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(auth_header, f'Bearer {ADMIN_API_TOKEN}'):
+            return jsonify({"error": "Требуется авторизация"}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
 def auth_required(f):
     """Универсальный декоратор для проверки авторизации"""
     @wraps(f)
@@ -157,17 +787,9 @@ def auth_required(f):
             if not payload:
                 return jsonify({"error": "Неверный токен"}), 401
             
-            # Проверяем активность сессии в БД
-            with get_db() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT 1 FROM codes 
-                    WHERE user_id = %s AND session_id = %s AND is_used = 1 AND expires_at > %s
-                ''', (payload['user_id'], payload.get('session_id'), datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-                active_session = cursor.fetchone()
-                
-                if not active_session:
-                    return jsonify({"error": "Сессия истекла"}), 401
+            # Проверяем активность сессии (токен, кэш, затем БД)
+            if not is_token_session_active(payload):
+                return jsonify({"error": "Сессия истекла"}), 401
             
             request.user_id = payload['user_id']
             return f(*args, **kwargs)
@@ -183,21 +805,18 @@ def auth_required(f):
 @auth_required
 def home():
     """Главная страница"""
-    with get_db() as conn:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute('''
-            SELECT expires_at FROM codes 
-            WHERE user_id = %s AND session_id = %s AND is_used = TRUE
-        ''', (session['user_id'], session.get('session_id')))
-        user_data = cursor.fetchone()
-        
-        if not user_data:
-            session.clear()
-            return redirect(url_for('login_page'))
-        
-        return render_template('dashboard.html',
-                            user_id=session['user_id'],
-                            expires_at=str(user_data['expires_at']))
+    user_data = fetch_session_row('''
+        SELECT expires_at FROM codes 
+        WHERE user_id = %s AND session_id = %s AND is_used = TRUE
+    ''', (session['user_id'], session.get('session_id')), session['user_id'], dictionary=True)
+    
+    if not user_data:
+        session.clear()
+        return redirect(url_for('login_page'))
+    
+    return render_template('dashboard.html',
+                        user_id=session['user_id'],
+                        expires_at=str(user_data['expires_at']))
 
 @app.route('/login', methods=['GET', 'POST'])
 def login_page():
@@ -205,26 +824,21 @@ def login_page():
     try:
         # Проверка существующей сессии
         if not request.args.get('no_redirect') and 'user_id' in session and session.get('session_id'):
-            with get_db() as conn:
-                cursor = conn.cursor(dictionary=True)
-                cursor.execute('''
-                    SELECT 1 FROM codes 
-                    WHERE user_id = %s AND session_id = %s AND is_used = 1 AND expires_at > %s
-                ''', (session['user_id'], session['session_id'], datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-                session_active = cursor.fetchone()
-                
-                if session_active:
+            try:
+                if get_active_session(session['user_id'], session['session_id']):
                     return redirect(url_for('dashboard'))
+            except DatabaseUnavailable:
+                pass  # Форма входа должна открываться и без БД
 
         # Обработка POST-запроса (попытка входа)
         if request.method == 'POST':
             code = request.form.get('code', '').strip().upper()
-            app.logger.info(f"Attempting login with code length: {len(code)}")
+            log_sampled("Attempting login with code length: %d", len(code))
             
             with get_db() as conn:
                 cursor = conn.cursor(dictionary=True)
                 cursor.execute('''
-                    SELECT user_id, expires_at FROM codes 
+                    SELECT user_id, expires_at, tariff FROM codes 
                     WHERE code = %s AND is_used = 0 AND expires_at > %s
                 ''', (code, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
                 code_data = cursor.fetchone()
@@ -239,11 +853,16 @@ def login_page():
                         WHERE code = %s
                     ''', (session_id, code))
                     conn.commit()
+                    session_cache.invalidate(code_data['user_id'])
+                    db_router.pin(code_data['user_id'])
                     
                     session['user_id'] = code_data['user_id']
                     session['session_id'] = session_id
                     session['expires_at'] = str(code_data['expires_at'])
-                    app.logger.info(f"Successful login for user_id: {code_data['user_id']}")
+                    access_log_writer.log_login(code_data['user_id'], code, client_ip(),
+                                                request.headers.get('User-Agent'), session_id,
+                                                code_data['tariff'])
+                    log_sampled("Successful login for user_id: %s", code_data['user_id'])
                     
                     return redirect(url_for('dashboard'))
                 
@@ -257,6 +876,8 @@ def login_page():
         response.headers['Expires'] = '0'
         return response
 
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
         app.logger.error(f"Login error: {str(e)}")
         return jsonify({"error": "Ошибка сервера", "details": str(e)}), 500
@@ -270,7 +891,7 @@ def api_login():
         with get_db() as conn:
             cursor = conn.cursor(dictionary=True)
             cursor.execute('''
-                SELECT user_id, expires_at FROM codes 
+                SELECT user_id, expires_at, tariff FROM codes 
                 WHERE code = %s AND is_used = FALSE AND expires_at > %s
             ''', (code, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
             code_data = cursor.fetchone()
@@ -282,8 +903,13 @@ def api_login():
                     SET is_used = TRUE, session_id = %s
                     WHERE code = %s
                 ''', (session_id, code))
+                session_cache.invalidate(code_data['user_id'])
+                db_router.pin(code_data['user_id'])
+                access_log_writer.log_login(code_data['user_id'], code, client_ip(),
+                                            request.headers.get('User-Agent'), session_id,
+                                            code_data['tariff'])
                 
-                token = create_jwt_token(code_data['user_id'])
+                token = create_jwt_token(code_data['user_id'], session_id, code_data['expires_at'])
                 
                 return jsonify({
                     'token': token,
@@ -292,20 +918,65 @@ def api_login():
         
         return jsonify({'error': 'Неверный код'}), 401
         
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
         app.logger.error(f"Login error: {str(e)}")
         return jsonify({'error': 'Ошибка сервера'}), 500
 
+@app.route('/logout', methods=['GET', 'POST'])
+def logout():
+    """Выход: завершаем сессию в БД, очищаем cookie и фиксируем время выхода в access_logs"""
+    user_id = session.get('user_id')
+    session_id = session.get('session_id')
+    auth_header = request.headers.get('Authorization', '')
+    if not session_id and auth_header.startswith('Bearer '):
+        payload = verify_jwt_token(auth_header.replace('Bearer ', ''))
+        if payload:
+            user_id, session_id = payload['user_id'], payload.get('session_id')
+    if session_id:
+        try:
+            end_session(user_id, session_id)
+        except Exception as e:
+            # Выход не должен зависеть от доступности БД
+            app.logger.error(f"Logout error: {str(e)}")
+        access_log_writer.log_logout(session_id)
+    session.clear()
+    return redirect(url_for('login_page', no_redirect='1'))
+
+def end_session(user_id, session_id):
+    """Отвязка сессии от кода и запись отзыва: JWT этой сессии отклоняется
+    и быстрым путём (revoked_sessions), и проверкой в БД после окна"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        conn.start_transaction()
+        cursor.execute('''
+            UPDATE codes
+            SET session_id = NULL
+            WHERE user_id = %s AND session_id = %s
+        ''', (user_id, session_id))
+        revocation_list.revoke(cursor, [session_id])
+        conn.commit()
+    session_cache.invalidate(user_id, session_id)
+
+def conditional_json(data, etag, headers=None):
+    """JSON-ответ с ETag; если клиент прислал тот же If-None-Match — 304 без тела"""
+    status, body, etag_headers = conditional(data, etag, request.headers.get('If-None-Match'))
+    response = make_response('', 304) if body is None else make_response(jsonify(body))
+    for key, value in dict(etag_headers, **(headers or {})).items():
+        response.headers[key] = value
+    return response
+
 @app.route('/api/session_data')
 def get_session_data():
     if 'user_id' not in session:
         return jsonify({"error": "No active session"}), 401
     
-    return jsonify({
+    return conditional_json({
         "user_id": session['user_id'],
         "session_id": session['session_id'],
         "expires_at": session['expires_at']
-    })
+    }, state_etag(session['user_id'], session['session_id'], session['expires_at']))
 
 @app.route('/api/check_session')
 def check_session_status():
@@ -337,27 +1008,29 @@ def check_session_status():
 
     # Проверяем частоту запросов
     if not can_check_session(user_id):
+        # Версию состояния можно подтвердить из кэша сессий без обращения к БД
+        expires_at = session_cache.get(user_id, session_id)
+        if expires_at is not None and request.headers.get('If-None-Match'):
+            return conditional_json({
+                "status": "active",
+                "expires_at": str(expires_at),
+                "cache_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }, state_etag('active', user_id, session_id, str(expires_at)), response_headers)
         return jsonify({
             "status": "active",
             "cached": True,
             "expires_in": 30  # Добавляем информацию о времени истечения кэша
         }), 200, response_headers
 
-    with get_db() as conn:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute('''
-            SELECT expires_at FROM codes 
-            WHERE user_id = %s AND session_id = %s AND is_used = TRUE AND expires_at > %s
-        ''', (user_id, session_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-        code_data = cursor.fetchone()
-        
-        if code_data:
-            response_data = {
-                "status": "active",
-                "expires_at": str(code_data['expires_at']),
-                "cache_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-            return jsonify(response_data), 200, response_headers
+    expires_at = get_active_session(user_id, session_id)
+    if expires_at:
+        response_data = {
+            "status": "active",
+            "expires_at": str(expires_at),
+            "cache_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        return conditional_json(response_data, state_etag('active', user_id, session_id, str(expires_at)),
+                                response_headers)
     
     return jsonify({"status": "expired"}), 401, response_headers
 
@@ -386,18 +1059,165 @@ def session_updated():
                     WHERE user_id = %s AND session_id = %s
                 ''', (user_id, session_id))
                 conn.commit()
+                session_cache.invalidate(user_id, session_id)
                 
                 return jsonify({
                     'status': 'updated',
                     'expires_at': str(session['expires_at'])
                 })
         
-        return jsonify({'status': 'no_update_needed'})
+        expires_at = str(session['expires_at']) if session else None
+        return conditional_json({'status': 'no_update_needed'},
+                                state_etag('no_update_needed', user_id, session_id, expires_at))
         
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
         app.logger.error(f"Session update error: {str(e)}")
         return jsonify({'error': 'Server error'}), 500
 
+@app.route('/api/session_events')
+def session_events():
+    """Server-Sent Events: обновление и истечение сессии без опроса"""
+    if not SSE_ENABLED:
+        abort(404)
+    user_id = request.args.get('user_id')
+    session_id = request.args.get('session_id')
+
+    if not user_id or not session_id:
+        return jsonify({'error': 'Missing required fields'}), 400
+
+    def stream():
+        events = session_watcher.subscribe(user_id, session_id)
+        deadline = time.monotonic() + SSE_MAX_STREAM
+        try:
+            yield "retry: 5000\n\n"
+            while time.monotonic() < deadline:
+                try:
+                    event, data = events.get(timeout=SSE_HEARTBEAT)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                yield format_event(event, data)
+                if event == 'expired':
+                    break
+        finally:
+            session_watcher.unsubscribe(user_id, session_id, events)
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/admin/codes/bulk', methods=['POST'])
+@admin_required
+def bulk_issue_codes():
+    """Массовый выпуск кодов; коды отдаются потоком по мере записи пачек"""
+    data = request.get_json(silent=True) or {}
+    fmt = data.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+
+    try:
+        if data.get('user_ids'):
+            user_ids = [int(user_id) for user_id in data['user_ids']]
+        else:
+            # Размер проверяется до построения списка: огромный count не должен занимать память
+            count = int(data['count'])
+            if not 0 < count <= MAX_BULK_CODES:
+                return jsonify({'error': f'From 1 to {MAX_BULK_CODES} codes per request'}), 400
+            user_ids = [int(data['user_id'])] * count
+        if data.get('expires_at'):
+            expires_at = datetime.strptime(data['expires_at'], "%Y-%m-%d %H:%M:%S")
+        else:
+            valid_days = int(data.get('valid_days', 30))
+            if not 1 <= valid_days <= MAX_VALID_DAYS:
+                return jsonify({'error': f'valid_days must be from 1 to {MAX_VALID_DAYS}'}), 400
+            expires_at = datetime.now() + timedelta(days=valid_days)
+        chunk_size = min(int(data.get('chunk_size', 1000)), 5000)
+    except (KeyError, TypeError, ValueError, OverflowError):
+        return jsonify({'error': 'Expected user_ids or user_id+count, and expires_at or valid_days'}), 400
+
+    prefix = data.get('prefix', '')
+    try:
+        validate_prefix(prefix)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if not user_ids or len(user_ids) > MAX_BULK_CODES:
+        return jsonify({'error': f'From 1 to {MAX_BULK_CODES} codes per request'}), 400
+    if chunk_size < 1:
+        return jsonify({'error': 'chunk_size must be from 1 to 5000'}), 400
+
+    def stream():
+        stats = {}
+        for rows in issue_codes(get_db, user_ids, expires_at, data.get('tariff'), chunk_size,
+                                prefix=prefix, stats=stats):
+            yield _format_issued(rows, fmt)
+        if fmt == 'ndjson':
+            yield json.dumps({'summary': stats}) + '\n'
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(stream()), mimetype=mimetype)
+
+@app.route('/api/admin/sessions/<action>', methods=['POST'])
+@admin_required
+def bulk_update_sessions_endpoint(action):
+    """Массовое продление, отзыв или обновление сессий по user_ids или тарифу"""
+    if action not in SESSION_ACTIONS:
+        return jsonify({'error': f'Unknown action, expected one of: {", ".join(SESSION_ACTIONS)}'}), 404
+    data = request.get_json(silent=True) or {}
+
+    try:
+        user_ids = [int(user_id) for user_id in data['user_ids']] if data.get('user_ids') is not None else None
+        tariff = data.get('tariff')
+        expires_at = None
+        extend_seconds = None
+        if action == 'extend':
+            if data.get('expires_at'):
+                expires_at = datetime.strptime(data['expires_at'], "%Y-%m-%d %H:%M:%S")
+            else:
+                extend_days = float(data['extend_days'])
+                # NaN и бесконечность тоже не проходят проверку диапазона
+                if not 1 <= extend_days <= MAX_VALID_DAYS:
+                    return jsonify({'error': f'extend_days must be from 1 to {MAX_VALID_DAYS}'}), 400
+                extend_seconds = int(extend_days * 86400)
+        chunk_size = min(int(data.get('chunk_size', 1000)), 5000)
+    except (KeyError, TypeError, ValueError, OverflowError):
+        return jsonify({'error': 'Expected user_ids or tariff; extend also needs expires_at or extend_days'}), 400
+
+    if (user_ids is None) == (tariff is None):
+        return jsonify({'error': 'Expected exactly one of user_ids or tariff'}), 400
+    if user_ids is not None and not 0 < len(user_ids) <= MAX_BULK_USERS:
+        return jsonify({'error': f'From 1 to {MAX_BULK_USERS} user_ids per request'}), 400
+    if chunk_size < 1:
+        return jsonify({'error': 'chunk_size must be from 1 to 5000'}), 400
+
+    stats = bulk_update_sessions(
+        get_db, action, user_ids=user_ids, tariff=tariff,
+        extend_seconds=extend_seconds, expires_at=expires_at, chunk_size=chunk_size,
+        include_expired=bool(data.get('include_expired')),
+        revocation_list=revocation_list, on_change=session_cache.invalidate
+    )
+    return jsonify(stats)
+
+@app.route('/api/admin/stats/logins')
+@admin_required
+def login_stats_endpoint():
+    """Входы и уникальные пользователи по дням; читает только сводку access_log_daily"""
+    try:
+        date_to = datetime.strptime(request.args['to'], "%Y-%m-%d").date() if request.args.get('to') \
+            else datetime.now().date()
+        date_from = datetime.strptime(request.args['from'], "%Y-%m-%d").date() if request.args.get('from') \
+            else date_to - timedelta(days=29)
+    except ValueError:
+        return jsonify({'error': 'Expected from and to as YYYY-MM-DD'}), 400
+    if not 0 <= (date_to - date_from).days < MAX_STATS_DAYS:
+        return jsonify({'error': f'From 1 to {MAX_STATS_DAYS} days per request'}), 400
+
+    stats = login_stats(get_db, date_from, date_to, tariff=request.args.get('tariff'))
+    return jsonify(stats)
+
 @app.route('/dashboard')
 def dashboard():
     try:
@@ -418,20 +1238,13 @@ def dashboard():
             token = auth_header.replace('Bearer ', '')
             try:
                 payload = verify_jwt_token(token)
-                if payload:
-                    with get_db() as conn:
-                        cursor = conn.cursor()
-                        cursor.execute('''
-                            SELECT 1 FROM codes 
-                            WHERE user_id = %s AND session_id = %s AND is_used = 1 AND expires_at > %s
-                        ''', (payload['user_id'], payload.get('session_id'), datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-                        session_active = cursor.fetchone()
-                        
-                        if session_active:
-                            response = make_response(render_template('dashboard.html'))
-                            for key, value in response_headers.items():
-                                response.headers[key] = value
-                            return response
+                if payload and is_token_session_active(payload):
+                    response = make_response(render_template('dashboard.html'))
+                    for key, value in response_headers.items():
+                        response.headers[key] = value
+                    return response
+            except DatabaseUnavailable:
+                raise
             except Exception as e:
                 app.logger.error(f"JWT or database error: {str(e)}")
                 return jsonify({"error": "Ошибка проверки токена"}), 401
@@ -439,19 +1252,13 @@ def dashboard():
         # Проверяем обычную сессию
         if 'user_id' in session and session.get('session_id'):
             try:
-                with get_db() as conn:
-                    cursor = conn.cursor()
-                    cursor.execute('''
-                        SELECT 1 FROM codes 
-                        WHERE user_id = %s AND session_id = %s AND is_used = 1 AND expires_at > %s
-                    ''', (session['user_id'], session['session_id'], datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-                    session_active = cursor.fetchone()
-                    
-                    if session_active:
-                        response = make_response(render_template('dashboard.html'))
-                        for key, value in response_headers.items():
-                            response.headers[key] = value
-                        return response
+                if get_active_session(session['user_id'], session['session_id']):
+                    response = make_response(render_template('dashboard.html'))
+                    for key, value in response_headers.items():
+                        response.headers[key] = value
+                    return response
+            except DatabaseUnavailable:
+                raise
             except Exception as e:
                 app.logger.error(f"Session check error: {str(e)}")
                 return jsonify({"error": "Ошибка проверки сессии"}), 500
@@ -459,32 +1266,15 @@ def dashboard():
         # Если нет активной сессии, перенаправляем на страницу входа
         return redirect(url_for('login_page', no_redirect='1'))
 
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
         app.logger.error(f"Unexpected error in dashboard: {str(e)}")
         return jsonify({"error": "Критическая ошибка сервера"}), 500
 
-    # Проверяем обычную сессию
-    if 'user_id' in session and session.get('session_id'):
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT 1 FROM codes 
-                WHERE user_id = %s AND session_id = %s AND is_used = 1 AND expires_at > %s
-            ''', (session['user_id'], session['session_id'], datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-            session_active = cursor.fetchone()
-            
-            if session_active:
-                response = make_response(render_template('dashboard.html'))
-                for key, value in response_headers.items():
-                    response.headers[key] = value
-                return response
-
-    # Добавляем параметр для предотвращения циклических редиректов
-    return redirect(url_for('login_page', no_redirect='1'))
-
 if __name__ == '__main__':
     # Инициализируем базу данных при первом запуске
-    init_db()
+    create_app()
     print("База данных инициализирована")
     
     # Получаем порт из переменных окружения или используем 5000 по умолчанию
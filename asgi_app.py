@@ -0,0 +1,231 @@
+"""Асинхронная (ASGI) точка входа для эндпоинтов авторизации.
+
+Те же /api/login, /api/check_session и /api/session_updated, что и в app.py,
+но поверх пула aiomysql: ожидание удалённой MySQL не занимает воркер,
+и один процесс держит тысячи одновременных проверок сессии.
+
+    uvicorn asgi_app:app --workers 2
+
+Конфигурация, JWT, кэш сессий, ограничитель частоты и журнал входов берутся
+из app.py; Flask-приложение при этом продолжает работать как раньше.
+Работает только с DB_BACKEND=mysql: для встроенной SQLite запускайте app.py.
+"""
+import os
+import secrets
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import aiomysql
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+import app as flask_app
+from etags import state_etag, conditional
+
+MYSQL_CONFIG = flask_app.MYSQL_CONFIG
+db_pool = None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global db_pool
+    # Пул aiomysql ходит только в MySQL: со встроенной SQLite проверки сессий
+    # и журнал входов разошлись бы по двум разным хранилищам
+    if flask_app.DB_BACKEND != 'mysql':
+        raise RuntimeError(f"asgi_app requires DB_BACKEND=mysql (got {flask_app.DB_BACKEND!r}); "
+                           f"serve the SQLite backend through app.py")
+    # Миграции — один раз на деплой (см. SCHEMA_CHECK в app.py)
+    flask_app.ensure_schema()
+    db_pool = await aiomysql.create_pool(
+        host=MYSQL_CONFIG['host'],
+        user=MYSQL_CONFIG['user'],
+        password=MYSQL_CONFIG['password'],
+        db=MYSQL_CONFIG['database'],
+        connect_timeout=MYSQL_CONFIG['connect_timeout'],
+        minsize=int(os.environ.get('ASYNC_DB_POOL_MIN', 1)),
+        maxsize=int(os.environ.get('ASYNC_DB_POOL_SIZE', 20)),
+        pool_recycle=int(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+        autocommit=True
+    )
+    # Сброс журнала входов и прочие фоновые задачи — в потоках планировщика
+    flask_app.start_scheduler()
+    try:
+        yield
+    finally:
+        db_pool.close()
+        await db_pool.wait_closed()
+        flask_app.access_log_writer.flush()
+
+
+async def get_active_session(user_id, session_id):
+    """Срок действия активной сессии или None (кэш, затем БД)"""
+    expires_at = flask_app.session_cache.get(user_id, session_id)
+    if expires_at is not None:
+        return expires_at
+
+    async with db_pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute('''
+                SELECT expires_at FROM codes
+                WHERE user_id = %s AND session_id = %s AND is_used = 1 AND expires_at > %s
+            ''', (user_id, session_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            row = await cursor.fetchone()
+
+    if not row:
+        return None
+    flask_app.session_cache.set(user_id, session_id, row[0])
+    return row[0]
+
+
+def client_ip(request):
+    """IP клиента с учётом прокси"""
+    forwarded = request.headers.get('X-Forwarded-For')
+    if forwarded:
+        return forwarded.split(',')[0].strip()
+    return request.client.host if request.client else ''
+
+
+def conditional_json(request, data, etag, headers=None):
+    """JSON-ответ с ETag; если клиент прислал тот же If-None-Match — 304 без тела"""
+    status, body, etag_headers = conditional(data, etag, request.headers.get('If-None-Match'))
+    headers = dict(etag_headers, **(headers or {}))
+    if body is None:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(body, headers=headers)
+
+
+async def api_login(request):
+    try:
+        data = await request.json()
+        code = data.get('code', '').strip().upper()
+
+        async with db_pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute('''
+                    SELECT user_id, expires_at, tariff FROM codes
+                    WHERE code = %s AND is_used = FALSE AND expires_at > %s
+                ''', (code, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+                code_data = await cursor.fetchone()
+
+                if code_data:
+                    session_id = secrets.token_hex(16)
+                    await cursor.execute('''
+                        UPDATE codes
+                        SET is_used = TRUE, session_id = %s
+                        WHERE code = %s
+                    ''', (session_id, code))
+                    flask_app.session_cache.invalidate(code_data['user_id'])
+                    flask_app.access_log_writer.log_login(code_data['user_id'], code, client_ip(request),
+                                                          request.headers.get('User-Agent'), session_id,
+                                                          code_data['tariff'])
+
+                    token = flask_app.create_jwt_token(code_data['user_id'], session_id, code_data['expires_at'])
+
+                    return JSONResponse({
+                        'token': token,
+                        'expires_at': str(code_data['expires_at'])
+                    })
+
+        return JSONResponse({'error': 'Неверный код'}, status_code=401)
+
+    except Exception as e:
+        flask_app.logger.error(f"Login error: {str(e)}")
+        return JSONResponse({'error': 'Ошибка сервера'}, status_code=500)
+
+
+async def check_session_status(request):
+    response_headers = {
+        'Cache-Control': 'private, max-age=30'  # Разрешаем кэширование на 30 секунд
+    }
+
+    # Проверяем сначала Bearer токен
+    auth_header = request.headers.get('Authorization')
+    if auth_header and auth_header.startswith('Bearer '):
+        payload = flask_app.verify_jwt_token(auth_header.replace('Bearer ', ''))
+        if not payload:
+            return JSONResponse({"status": "invalid"}, status_code=401, headers=response_headers)
+        user_id = payload['user_id']
+        session_id = payload.get('session_id')
+    else:
+        # Если нет Bearer токена, используем заголовки X-User-Id и X-Session-Id
+        user_id = request.headers.get('X-User-Id')
+        session_id = request.headers.get('X-Session-Id')
+
+    if not user_id or not session_id:
+        return JSONResponse({"status": "invalid"}, status_code=401, headers=response_headers)
+
+    # Проверяем частоту запросов
+    if not flask_app.can_check_session(user_id):
+        # Версию состояния можно подтвердить из кэша сессий без обращения к БД
+        expires_at = flask_app.session_cache.get(user_id, session_id)
+        if expires_at is not None and request.headers.get('If-None-Match'):
+            return conditional_json(request, {
+                "status": "active",
+                "expires_at": str(expires_at),
+                "cache_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }, state_etag('active', user_id, session_id, str(expires_at)), response_headers)
+        return JSONResponse({
+            "status": "active",
+            "cached": True,
+            "expires_in": 30
+        }, headers=response_headers)
+
+    expires_at = await get_active_session(user_id, session_id)
+    if expires_at:
+        return conditional_json(request, {
+            "status": "active",
+            "expires_at": str(expires_at),
+            "cache_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }, state_etag('active', user_id, session_id, str(expires_at)), response_headers)
+
+    return JSONResponse({"status": "expired"}, status_code=401, headers=response_headers)
+
+
+async def session_updated(request):
+    try:
+        data = await request.json()
+        user_id = data.get('user_id')
+        session_id = data.get('session_id')
+
+        if not user_id or not session_id:
+            return JSONResponse({'error': 'Missing required fields'}, status_code=400)
+
+        async with db_pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute('''
+                    SELECT needs_refresh, expires_at FROM codes
+                    WHERE user_id = %s AND session_id = %s AND is_used = TRUE
+                ''', (user_id, session_id))
+                row = await cursor.fetchone()
+
+                if row and row['needs_refresh']:
+                    await cursor.execute('''
+                        UPDATE codes
+                        SET needs_refresh = FALSE
+                        WHERE user_id = %s AND session_id = %s
+                    ''', (user_id, session_id))
+                    flask_app.session_cache.invalidate(user_id, session_id)
+
+                    return JSONResponse({
+                        'status': 'updated',
+                        'expires_at': str(row['expires_at'])
+                    })
+
+        expires_at = str(row['expires_at']) if row else None
+        return conditional_json(request, {'status': 'no_update_needed'},
+                                state_etag('no_update_needed', user_id, session_id, expires_at))
+
+    except Exception as e:
+        flask_app.logger.error(f"Session update error: {str(e)}")
+        return JSONResponse({'error': 'Server error'}, status_code=500)
+
+
+app = Starlette(
+    routes=[
+        Route('/api/login', api_login, methods=['POST']),
+        Route('/api/check_session', check_session_status),
+        Route('/api/session_updated', session_updated, methods=['POST']),
+    ],
+    lifespan=lifespan
+)
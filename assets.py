@@ -0,0 +1,195 @@
+"""Сборка статики: хэш в имени файла, минификация, gzip/brotli-варианты.
+
+    python assets.py            # или: flask --app app build-assets
+
+Результат — static/dist/ с файлами вида style.3f9a1c2b7d.css, их .gz/.br
+и dist/manifest.json (логическое имя -> хэшированное). Ссылки вида
+/static/<имя> внутри CSS/JS/manifest.json и в сервис-воркерах переписываются
+на хэшированные URL; сервис-воркеры получают CACHE_NAME с хэшем сборки.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен: без него отдаём только gzip
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+ASSET_URL_PREFIX = '/assets/'
+
+# Сервис-воркеры должны жить по постоянному URL, их не хэшируем
+SERVICE_WORKERS = ('sw.js', 'service-worker.js')
+# Черновики, которые не подключаются страницами
+SKIP = ('script.new.js',)
+TEXT_EXTENSIONS = ('.css', '.js', '.json', '.svg')
+COMPRESS_MIN_SIZE = 256
+
+_CSS_COMMENT = re.compile(r'/\*.*?\*/', re.DOTALL)
+
+
+def minify(name, content):
+    """Минификация CSS/JS; без rjsmin/rcssmin — только безопасная чистка CSS"""
+    if name.endswith('.js'):
+        return rjsmin.jsmin(content) if rjsmin else content
+    if name.endswith('.css'):
+        if rcssmin:
+            return rcssmin.cssmin(content)
+        content = _CSS_COMMENT.sub('', content)
+        return '\n'.join(line.strip() for line in content.splitlines() if line.strip()) + '\n'
+    return content
+
+
+def rewrite_references(content, urls):
+    """Замена /static/<имя> на хэшированные URL (длинные имена первыми)"""
+    for name in sorted(urls, key=len, reverse=True):
+        content = content.replace(f'/static/{name}', urls[name])
+    return content
+
+
+def hashed_name(name, data):
+    digest = hashlib.sha256(data).hexdigest()[:10]
+    stem, ext = os.path.splitext(name.replace(' ', '-'))
+    return f'{stem}.{digest}{ext}'
+
+
+def _write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _build_order(name):
+    # Сначала бинарные файлы, потом тексты, которые на них ссылаются, JS — последним
+    ext = os.path.splitext(name)[1]
+    if ext not in TEXT_EXTENSIONS:
+        return 0
+    return 2 if ext == '.js' else 1
+
+
+def build(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    """Полная пересборка dist/; возвращает манифест"""
+    os.makedirs(dist_dir, exist_ok=True)
+    for old in os.listdir(dist_dir):
+        os.remove(os.path.join(dist_dir, old))
+
+    names = sorted(
+        (name for name in os.listdir(static_dir)
+         if os.path.isfile(os.path.join(static_dir, name))
+         and name not in SERVICE_WORKERS and name not in SKIP),
+        key=lambda name: (_build_order(name), name)
+    )
+
+    files = {}
+    urls = {}
+    for name in names:
+        with open(os.path.join(static_dir, name), 'rb') as f:
+            data = f.read()
+        if name.endswith(TEXT_EXTENSIONS):
+            text = rewrite_references(data.decode('utf-8'), urls)
+            data = minify(name, text).encode('utf-8')
+
+        target = hashed_name(name, data)
+        _write(os.path.join(dist_dir, target), data)
+        _write_compressed(os.path.join(dist_dir, target), name, data)
+        files[name] = target
+        urls[name] = ASSET_URL_PREFIX + target
+
+    build_id = hashlib.sha256(json.dumps(files, sort_keys=True).encode()).hexdigest()[:10]
+    for name in SERVICE_WORKERS:
+        path = os.path.join(static_dir, name)
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding='utf-8') as f:
+            content = rewrite_references(f.read(), urls)
+        content = re.sub(r"const CACHE_NAME = '([\w-]+?)(?:-\w{10})?';",
+                         lambda m: f"const CACHE_NAME = '{m.group(1)}-{build_id}';", content, count=1)
+        _write(os.path.join(dist_dir, name), content.encode('utf-8'))
+
+    manifest = {'build': build_id, 'files': files}
+    with open(os.path.join(dist_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    return manifest
+
+
+def _write_compressed(path, name, data):
+    if not name.endswith(TEXT_EXTENSIONS) or len(data) < COMPRESS_MIN_SIZE:
+        return
+    _write(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        _write(path + '.br', brotli.compress(data, quality=11))
+
+
+class AssetManifest:
+    """Соответствие логических имён хэшированным файлам (из dist/manifest.json).
+
+    Без сборки отдаёт обычные /static/ URL, чтобы локальная разработка
+    работала без дополнительного шага.
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self.files = {}
+        self.targets = set()
+        self.build_id = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            self.files, self.targets, self.build_id = {}, set(), None
+            return
+        self.files = manifest.get('files', {})
+        self.targets = set(self.files.values())
+        self.build_id = manifest.get('build')
+
+    def url(self, name):
+        target = self.files.get(name)
+        if target is None:
+            return f'/static/{name}'
+        return ASSET_URL_PREFIX + target
+
+    def is_known(self, filename):
+        return filename in self.targets
+
+
+def choose_encoding(accept_encoding, path):
+    """Лучший доступный предсжатый вариант: (путь, Content-Encoding или None)"""
+    accepted = set()
+    for part in (accept_encoding or '').lower().split(','):
+        coding, _, params = part.partition(';')
+        if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(coding.strip())
+    if 'br' in accepted and os.path.exists(path + '.br'):
+        return path + '.br', 'br'
+    if 'gzip' in accepted and os.path.exists(path + '.gz'):
+        return path + '.gz', 'gzip'
+    return path, None
+
+
+def guess_type(filename):
+    if filename.endswith('.js'):
+        return 'application/javascript'
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+if __name__ == '__main__':
+    result = build()
+    print(f"Built {len(result['files'])} assets into {DIST_DIR} (build {result['build']})")
@@ -0,0 +1,220 @@
+"""Нагрузочный бенчмарк эндпоинтов входа и проверки сессии.
+
+Поднимает app.py на локальном порту поверх подменной БД (benchmarks/fake_db.py),
+засевает коды и гоняет каждый сценарий с заданной параллельностью.
+Результат — JSON с p50/p95/p99, пропускной способностью и числом запросов
+к БД на HTTP-запрос, чтобы сравнивать прогоны до и после изменений.
+
+    python benchmarks/bench_endpoints.py --requests 2000 --concurrency 16 \\
+        --db-latency-ms 5 --output before.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_db import FakeDatabase  # noqa: E402
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class Client:
+    """HTTP-клиент с keep-alive; по одному на поток"""
+
+    _local = threading.local()
+
+    def __init__(self, port):
+        self.port = port
+
+    def request(self, method, path, body=None, headers=None):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            response = conn.getresponse()
+            data = response.read()
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            self._local.conn = None
+            raise
+        return response.status, dict(response.getheaders()), data
+
+
+def run_scenario(name, client, db, build_request, total, concurrency, ok_statuses):
+    """Прогон одного сценария: total запросов при заданной параллельности"""
+    latencies = []
+    statuses = {}
+    errors = 0
+    lock = threading.Lock()
+    queries_before, connects_before = db.counter.snapshot()
+
+    def one(i):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            # Ошибка построения запроса (например, коды кончились) — ошибка этого запроса, а не всего прогона
+            method, path, body, headers = build_request(i)
+            status, _, _ = client.request(method, path, body, headers)
+        except Exception:
+            status = 'error'
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if status not in ok_statuses:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    wall = time.perf_counter() - started
+
+    queries_after, connects_after = db.counter.snapshot()
+    ms = [value * 1000 for value in latencies]
+    return {
+        'requests': total,
+        'concurrency': concurrency,
+        'errors': errors,
+        'statuses': statuses,
+        'wall_seconds': round(wall, 3),
+        'throughput_rps': round(total / wall, 1) if wall else None,
+        'latency_ms': {
+            'p50': round(percentile(ms, 50), 3),
+            'p95': round(percentile(ms, 95), 3),
+            'p99': round(percentile(ms, 99), 3),
+            'mean': round(statistics.fmean(ms), 3),
+            'max': round(max(ms), 3),
+        },
+        'db_queries_per_request': round((queries_after - queries_before) / total, 3),
+        'db_connects': connects_after - connects_before,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--codes', type=int, default=10000, help='сколько кодов засеять (минимум — на все входы)')
+    parser.add_argument('--requests', type=int, default=1000, help='запросов на сценарий')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--warmup', type=int, default=20, help='прогревочных запросов на сценарий (не учитываются)')
+    parser.add_argument('--db-latency-ms', type=float, default=0.0, help='задержка на каждый SQL-запрос')
+    parser.add_argument('--connect-latency-ms', type=float, default=0.0, help='задержка на установку соединения')
+    parser.add_argument('--scenarios', default='login_page,login_form,api_login,check_session,session_updated,dashboard')
+    parser.add_argument('--output', default=os.path.join(ROOT, 'benchmarks', 'results.json'))
+    args = parser.parse_args()
+
+    os.environ.setdefault('FLASK_SECRET_KEY', 'bench-secret')
+    os.environ.setdefault('JWT_SECRET_KEY', 'bench-jwt-secret-0123456789abcdef0123')
+    os.environ.setdefault('CODES_SWEEPER', '0')
+
+    workdir = tempfile.mkdtemp(prefix='auth-bench-')
+    db = FakeDatabase(os.path.join(workdir, 'bench.sqlite3'),
+                      latency=args.db_latency_ms / 1000,
+                      connect_latency=args.connect_latency_ms / 1000)
+    # Входы сценариев login_form и api_login плюс входы для сбора сессий
+    session_logins = min(args.requests, 500)
+    logins_needed = 2 * (args.requests + args.warmup) + session_logins
+    codes = db.seed_codes(max(args.codes, logins_needed))
+
+    import logging
+    logging.disable(logging.INFO)
+
+    import app as app_module
+    app_module.db_pool._connect = db.connect
+
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    WSGIRequestHandler.protocol_version = 'HTTP/1.1'
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = Client(server.server_port)
+
+    import jwt
+    next_code = iter(codes)
+    sessions = []
+    sessions_lock = threading.Lock()
+
+    def login_form(i):
+        body = urlencode({'code': next(next_code)})
+        return 'POST', '/login', body, {'Content-Type': 'application/x-www-form-urlencoded'}
+
+    def api_login(i):
+        return 'POST', '/api/login', json.dumps({'code': next(next_code)}), {'Content-Type': 'application/json'}
+
+    def session_for(i):
+        return sessions[i % len(sessions)]
+
+    def bearer(i):
+        return {'Authorization': f"Bearer {session_for(i)['token']}"}
+
+    scenarios = {
+        'login_page': (lambda i: ('GET', '/login', None, {}), {200}),
+        'login_form': (login_form, {302}),
+        'api_login': (api_login, {200}),
+        'check_session': (lambda i: ('GET', '/api/check_session', None, bearer(i)), {200}),
+        'session_updated': (lambda i: ('POST', '/api/session_updated', json.dumps({
+            'user_id': session_for(i)['user_id'],
+            'session_id': session_for(i)['session_id'],
+        }), {'Content-Type': 'application/json'}), {200}),
+        'dashboard': (lambda i: ('GET', '/dashboard', None, bearer(i)), {200}),
+    }
+
+    # Сессии для сценариев, которым нужен токен
+    def collect(i):
+        status, _, data = client.request(*api_login(i))
+        if status == 200:
+            token = json.loads(data)['token']
+            claims = jwt.decode(token, options={'verify_signature': False})
+            with sessions_lock:
+                sessions.append({'token': token, 'user_id': claims['user_id'], 'session_id': claims['session_id']})
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(collect, range(session_logins)))
+    if not sessions:
+        raise SystemExit('Could not obtain any session via /api/login')
+
+    results = {}
+    for name in args.scenarios.split(','):
+        build_request, ok_statuses = scenarios[name]
+        for i in range(args.warmup):
+            client.request(*build_request(i))
+        results[name] = run_scenario(name, client, db, build_request,
+                                     args.requests, args.concurrency, ok_statuses)
+        print(f"{name:<16} p50={results[name]['latency_ms']['p50']}ms "
+              f"p99={results[name]['latency_ms']['p99']}ms "
+              f"rps={results[name]['throughput_rps']} "
+              f"q/req={results[name]['db_queries_per_request']} errors={results[name]['errors']}")
+
+    server.shutdown()
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'settings': vars(args),
+        'pool': app_module.db_pool.stats(),
+        'scenarios': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+"""Бенчмарк старта воркеров: холодный старт и масштабирование.
+
+Каждый воркер — отдельный процесс поверх подменной БД (benchmarks/fake_db.py)
+с задержкой на handshake. Замеряется время импорта app, create_app() и
+первого запроса /api/check_session, а также время, за которое N воркеров
+обслужили свой первый запрос:
+
+- spawn: N независимых процессов (gunicorn без --preload);
+- preload: мастер импортирует app и вызывает create_app(preload=True),
+  затем форкает N воркеров (gunicorn --preload).
+
+Каждый вариант прогоняется с DB_PREWARM=0 и с DB_PREWARM=--prewarm.
+
+    python benchmarks/bench_startup.py --workers 4 --connect-latency-ms 50 \\
+        --output startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_db import FakeDatabase  # noqa: E402
+
+SESSION_USER = 1
+SESSION_ID = 'bench-startup-session'
+
+
+def first_request(app_module):
+    """Первый запрос воркера; возвращает (секунды, статус)"""
+    client = app_module.app.test_client()
+    start = time.perf_counter()
+    response = client.get('/api/check_session',
+                          headers={'X-User-Id': str(SESSION_USER), 'X-Session-Id': SESSION_ID})
+    return time.perf_counter() - start, response.status_code
+
+
+def load_app(db):
+    import logging
+    logging.disable(logging.INFO)
+    start = time.perf_counter()
+    import app as app_module
+    imported = time.perf_counter()
+    app_module.db_pool._connect = db.connect
+    # Проверка схемы в create_app() идёт мимо пула — тоже в подменную БД
+    app_module._schema_connection = db.connect
+    return app_module, imported - start
+
+
+def run_worker(args):
+    """Режим --worker: один процесс без preload, результат — JSON в stdout"""
+    db = FakeDatabase(args.db, connect_latency=args.connect_latency_ms / 1000)
+    app_module, import_seconds = load_app(db)
+    start = time.perf_counter()
+    app_module.create_app()
+    create_seconds = time.perf_counter() - start
+    time.sleep(args.first_request_delay)
+    request_seconds, status = first_request(app_module)
+    print(json.dumps({
+        'import_seconds': import_seconds,
+        'create_app_seconds': create_seconds,
+        'first_request_seconds': request_seconds,
+        'status': status,
+    }))
+
+
+def run_master(args):
+    """Режим --master: create_app(preload=True) и fork воркеров"""
+    db = FakeDatabase(args.db, connect_latency=args.connect_latency_ms / 1000)
+    app_module, import_seconds = load_app(db)
+    start = time.perf_counter()
+    app_module.create_app(preload=True)
+    create_seconds = time.perf_counter() - start
+
+    fork_start = time.perf_counter()
+    pipes = []
+    for _ in range(args.workers):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            time.sleep(args.first_request_delay)
+            request_seconds, status = first_request(app_module)
+            ready = time.perf_counter() - fork_start
+            os.write(write_fd, json.dumps({
+                'first_request_seconds': request_seconds, 'ready_seconds': ready, 'status': status,
+            }).encode())
+            os._exit(0)
+        os.close(write_fd)
+        pipes.append((pid, read_fd))
+
+    workers = []
+    for pid, read_fd in pipes:
+        with os.fdopen(read_fd) as f:
+            workers.append(json.loads(f.read()))
+        os.waitpid(pid, 0)
+    print(json.dumps({
+        'import_seconds': import_seconds,
+        'create_app_seconds': create_seconds,
+        'workers_ready_seconds': max(worker['ready_seconds'] for worker in workers),
+        'workers': workers,
+    }))
+
+
+def child_env(prewarm, stamp):
+    env = dict(os.environ)
+    env.setdefault('FLASK_SECRET_KEY', 'bench-secret')
+    env.setdefault('JWT_SECRET_KEY', 'bench-jwt-secret-0123456789abcdef0123')
+    env['CODES_SWEEPER'] = '0'
+    # Ни одно соединение не должно уйти в настоящую MySQL из MYSQL_CONFIG
+    env['DB_HOST'] = 'bench.invalid'
+    env['DB_PREWARM'] = str(prewarm)
+    env['SCHEMA_STAMP'] = stamp
+    return env
+
+
+def child_command(mode, args):
+    return [sys.executable, os.path.abspath(__file__), mode, '--db', args.db,
+            '--workers', str(args.workers), '--connect-latency-ms', str(args.connect_latency_ms),
+            '--first-request-delay', str(args.first_request_delay)]
+
+
+def scenario_spawn(args, prewarm, stamp):
+    start = time.perf_counter()
+    processes = [subprocess.Popen(child_command('--worker', args), env=child_env(prewarm, stamp),
+                                  stdout=subprocess.PIPE, text=True)
+                 for _ in range(args.workers)]
+    workers = [json.loads(process.communicate()[0]) for process in processes]
+    return {
+        'workers_ready_seconds': time.perf_counter() - start,
+        'import_seconds': statistics.fmean(worker['import_seconds'] for worker in workers),
+        'create_app_seconds': statistics.fmean(worker['create_app_seconds'] for worker in workers),
+        'first_request_seconds': statistics.fmean(worker['first_request_seconds'] for worker in workers),
+        'errors': sum(1 for worker in workers if worker['status'] != 200),
+    }
+
+
+def scenario_preload(args, prewarm, stamp):
+    start = time.perf_counter()
+    output = subprocess.run(child_command('--master', args), env=child_env(prewarm, stamp),
+                            stdout=subprocess.PIPE, text=True, check=True).stdout
+    master = json.loads(output)
+    workers = master.pop('workers')
+    return {
+        'workers_ready_seconds': time.perf_counter() - start,
+        'import_seconds': master['import_seconds'],
+        'create_app_seconds': master['create_app_seconds'],
+        'fork_to_ready_seconds': master['workers_ready_seconds'],
+        'first_request_seconds': statistics.fmean(worker['first_request_seconds'] for worker in workers),
+        'errors': sum(1 for worker in workers if worker['status'] != 200),
+    }
+
+
+def seed_session(path):
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute('''
+        INSERT INTO codes (user_id, code, expires_at, is_used, session_id)
+        VALUES (?, ?, ?, 1, ?)
+    ''', (SESSION_USER, 'STARTUP0001', (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S"),
+          SESSION_ID))
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--connect-latency-ms', type=float, default=50.0, help='задержка на установку соединения')
+    parser.add_argument('--prewarm', type=int, default=2, help='DB_PREWARM для вариантов с прогревом')
+    parser.add_argument('--first-request-delay', type=float, default=0.2,
+                        help='пауза между готовностью воркера и первым запросом, с')
+    parser.add_argument('--repeat', type=int, default=3, help='прогонов каждого варианта (берётся медиана)')
+    parser.add_argument('--output', default=os.path.join(ROOT, 'benchmarks', 'results-startup.json'))
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--master', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return run_worker(args)
+    if args.master:
+        return run_master(args)
+
+    workdir = tempfile.mkdtemp(prefix='auth-startup-')
+    args.db = os.path.join(workdir, 'bench.sqlite3')
+    FakeDatabase(args.db)
+    seed_session(args.db)
+
+    results = {}
+    for name, scenario in (('spawn', scenario_spawn), ('preload', scenario_preload)):
+        for prewarm in (0, args.prewarm):
+            label = f"{name}{'_prewarm' if prewarm else ''}"
+            runs = []
+            for i in range(args.repeat):
+                # Своя отметка схемы на каждый прогон: каждый — как первый старт после деплоя
+                runs.append(scenario(args, prewarm, os.path.join(workdir, f'{label}-{i}.schema')))
+            result = {key: round(statistics.median(run[key] for run in runs), 4) for key in runs[0]}
+            result['errors'] = sum(run['errors'] for run in runs)
+            results[label] = result
+            print(f"{label:<16} ready={result['workers_ready_seconds'] * 1000:.1f}ms "
+                  f"import={result['import_seconds'] * 1000:.1f}ms "
+                  f"create_app={result['create_app_seconds'] * 1000:.1f}ms "
+                  f"first_request={result['first_request_seconds'] * 1000:.1f}ms errors={result['errors']}")
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'settings': {key: value for key, value in vars(args).items() if key not in ('worker', 'master')},
+        'scenarios': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Подмена MySQL для бенчмарков: встроенное хранилище SQLite (sqlite_store.py)
+со счётчиком запросов и искусственной задержкой на каждый запрос и
+handshake, чтобы имитировать удалённую БД.
+"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlite_store  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+
+class QueryCounter:
+    """Счётчики обращений к подменной БД (общие для всех соединений)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.connects = 0
+
+    def add_query(self):
+        with self._lock:
+            self.queries += 1
+
+    def add_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def snapshot(self):
+        with self._lock:
+            return self.queries, self.connects
+
+
+class FakeCursor(sqlite_store.SQLiteCursor):
+    def execute(self, sql, params=()):
+        self._conn._before_query()
+        super().execute(sql, params)
+
+    def executemany(self, sql, seq_params):
+        self._conn._before_query()
+        super().executemany(sql, seq_params)
+
+
+class FakeConnection(sqlite_store.SQLiteConnection):
+    def __init__(self, path, counter, latency=0.0):
+        super().__init__(path)
+        self._counter = counter
+        self._latency = latency
+
+    def _before_query(self):
+        self._counter.add_query()
+        if self._latency:
+            time.sleep(self._latency)
+
+    def cursor(self, dictionary=False, **kwargs):
+        return FakeCursor(self, dictionary=dictionary)
+
+    def ping(self, reconnect=False):
+        self._before_query()
+
+
+class FakeDatabase:
+    """SQLite-файл со схемой приложения и фабрикой соединений"""
+
+    def __init__(self, path, latency=0.0, connect_latency=0.0):
+        self.path = path
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.counter = QueryCounter()
+        conn = sqlite_store.connect(path)
+        migrate(conn)
+        conn.close()
+
+    def connect(self):
+        """Замена app._connect: новое «соединение» с учётом стоимости handshake"""
+        self.counter.add_connect()
+        if self.connect_latency:
+            time.sleep(self.connect_latency)
+        return FakeConnection(self.path, self.counter, self.latency)
+
+    def seed_codes(self, count, valid_for=timedelta(days=30), prefix='BENCH'):
+        """Неиспользованные коды BENCH000000..; user_id = номер + 1"""
+        expires_at = (datetime.now() + valid_for).strftime("%Y-%m-%d %H:%M:%S")
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        conn.execute('BEGIN')
+        conn.executemany(
+            'INSERT INTO codes (user_id, code, expires_at, tariff) VALUES (?, ?, ?, ?)',
+            ((i + 1, f'{prefix}{i:06d}', expires_at, 'bench') for i in range(count))
+        )
+        conn.execute('COMMIT')
+        conn.close()
+        return [f'{prefix}{i:06d}' for i in range(count)]
@@ -0,0 +1,75 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseUnavailable(Exception):
+    """БД недоступна: запрос отклонён без ожидания таймаутов"""
+
+
+class CircuitBreaker:
+    """Автомат защиты для обращений к БД.
+
+    - closed: запросы идут в БД, ошибки считаются в скользящем окне;
+    - open: после failure_threshold ошибок за window секунд запросы сразу
+      получают DatabaseUnavailable; восстановление проверяет фоновый probe()
+      не чаще раза в open_seconds, рабочие потоки БД не ждут.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+
+    def __init__(self, failure_threshold=5, window=30, open_seconds=15):
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.opened_at = None
+        self._failures = deque()
+        self._lock = threading.Lock()
+        self.times_opened = 0
+        self.rejected = 0
+
+    def allow(self):
+        if self.state == self.CLOSED:
+            return True
+        with self._lock:
+            self.rejected += 1
+        return False
+
+    def check(self):
+        """DatabaseUnavailable, если автомат разомкнут"""
+        if not self.allow():
+            raise DatabaseUnavailable('Database circuit is open')
+
+    def record_failure(self):
+        now = time.monotonic()
+        with self._lock:
+            self._failures.append(now)
+            while self._failures and self._failures[0] < now - self.window:
+                self._failures.popleft()
+            if self.state == self.CLOSED and len(self._failures) >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = now
+                self.times_opened += 1
+                logger.error(f"Database circuit opened after {len(self._failures)} failures in {self.window}s")
+
+    def probe(self, ping):
+        """Фоновая проверка восстановления: ping() без исключения замыкает автомат"""
+        if self.state != self.OPEN or time.monotonic() - self.opened_at < self.open_seconds:
+            return
+        try:
+            ping()
+        except Exception as e:
+            logger.warning(f"Database probe failed, circuit stays open: {str(e)}")
+            with self._lock:
+                self.opened_at = time.monotonic()
+            return
+        with self._lock:
+            self.state = self.CLOSED
+            self.opened_at = None
+            self._failures.clear()
+        logger.warning("Database probe succeeded, circuit closed")
@@ -0,0 +1,88 @@
+import logging
+import secrets
+import time
+
+logger = logging.getLogger(__name__)
+
+# Без похожих символов (0/O, 1/I/L): код вводят вручную из Telegram
+ALPHABET = 'ABCDEFGHJKMNPQRSTUVWXYZ23456789'
+CODE_LENGTH = 12  # 31^12 ≈ 7.9e17 вариантов — совпадения практически исключены
+MAX_CHUNK_RETRIES = 3
+# Префикс вводится вместе с кодом, а вход приводит ввод к верхнему регистру
+PREFIX_CHARS = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-')
+MAX_PREFIX_LENGTH = 32
+MAX_VALID_DAYS = 3650
+
+
+def validate_prefix(prefix):
+    """ValueError, если с таким префиксом код нельзя будет ввести при входе"""
+    if not isinstance(prefix, str):
+        raise ValueError('prefix must be a string')
+    if len(prefix) > MAX_PREFIX_LENGTH:
+        raise ValueError(f'prefix must be at most {MAX_PREFIX_LENGTH} characters')
+    if not set(prefix) <= PREFIX_CHARS:
+        raise ValueError('prefix may contain only A-Z, 0-9 and -')
+
+
+def generate_codes(count, length=CODE_LENGTH, prefix=''):
+    """count случайных уникальных (в пределах пачки) кодов"""
+    codes = set()
+    while len(codes) < count:
+        codes.add(prefix + ''.join(secrets.choice(ALPHABET) for _ in range(length)))
+    return list(codes)
+
+
+def issue_codes(get_db, user_ids, expires_at, tariff=None, chunk_size=1000, length=CODE_LENGTH, prefix='',
+                stats=None):
+    """Выпуск кодов пачками: по одному многострочному INSERT на транзакцию.
+
+    user_ids — по одному коду на каждый элемент. Генератор отдаёт список
+    (user_id, code) после фиксации каждой пачки; по завершении в stats
+    записывается число кодов, время и скорость. При редком совпадении с уже
+    существующим кодом пачка откатывается и генерируется заново.
+    """
+    import mysql.connector
+
+    validate_prefix(prefix)
+    start = time.monotonic()
+    expires_at = expires_at.strftime("%Y-%m-%d %H:%M:%S")
+    issued = 0
+    retries = 0
+
+    with get_db() as conn:
+        cursor = conn.cursor()
+        for i in range(0, len(user_ids), chunk_size):
+            chunk_users = user_ids[i:i + chunk_size]
+            for attempt in range(MAX_CHUNK_RETRIES + 1):
+                codes = generate_codes(len(chunk_users), length, prefix)
+                rows = list(zip(chunk_users, codes))
+                values = ', '.join(['(%s, %s, %s, %s)'] * len(rows))
+                params = []
+                for user_id, code in rows:
+                    params.extend((user_id, code, expires_at, tariff))
+                try:
+                    conn.start_transaction()
+                    cursor.execute(f'''
+                        INSERT INTO codes (user_id, code, expires_at, tariff)
+                        VALUES {values}
+                    ''', params)
+                    conn.commit()
+                    break
+                except mysql.connector.IntegrityError:
+                    conn.rollback()
+                    retries += 1
+                    if attempt == MAX_CHUNK_RETRIES:
+                        raise
+            issued += len(rows)
+            yield rows
+
+    elapsed = time.monotonic() - start
+    result = {
+        'issued': issued,
+        'chunk_retries': retries,
+        'seconds': round(elapsed, 3),
+        'codes_per_second': round(issued / elapsed, 1) if elapsed else None,
+    }
+    if stats is not None:
+        stats.update(result)
+    logger.info(f"Codes issued: {result}")
@@ -0,0 +1,215 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """Не удалось получить соединение из пула за отведённое время"""
+
+
+class PooledConnection:
+    """Обёртка над соединением: при выходе из `with` возвращает его в пул"""
+
+    def __init__(self, pool, raw, created_at, cursor_wrapper=None):
+        self._pool = pool
+        self._raw = raw
+        self._cursor_wrapper = cursor_wrapper
+        self.created_at = created_at
+        self.last_used = time.monotonic()
+        self.suspect = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def cursor(self, *args, **kwargs):
+        cursor = self._raw.cursor(*args, **kwargs)
+        if self._cursor_wrapper is not None:
+            cursor = self._cursor_wrapper(cursor)
+        return cursor
+
+    def __exit__(self, exc_type, exc, tb):
+        # После ошибки откатываем незавершённую транзакцию,
+        # а соединение проверяем пингом при следующей выдаче
+        if exc_type is not None:
+            self.suspect = True
+            if self._pool is not None and self._pool.on_error is not None:
+                self._pool.on_error(exc)
+            try:
+                self._raw.rollback()
+            except Exception:
+                pass
+        self.close()
+        return False
+
+    def close(self):
+        """Возврат соединения в пул (вместо настоящего закрытия)"""
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            pool._release(self)
+
+    @property
+    def raw(self):
+        return self._raw
+
+
+class ConnectionPool:
+    """Пул соединений с БД на один процесс-воркер.
+
+    - size: максимум соединений (занятых + свободных);
+    - max_lifetime: соединение старше этого возраста закрывается и пересоздаётся;
+    - ping_interval: соединение, простоявшее дольше, проверяется пингом при выдаче;
+    - timeout: сколько ждать свободного соединения, если пул исчерпан;
+    - cursor_wrapper: обёртка для курсоров (например, для замеров запросов);
+    - on_error: вызывается с исключением, прервавшим работу с соединением.
+    """
+
+    def __init__(self, connect, size=5, max_lifetime=1800, ping_interval=30, timeout=10, cursor_wrapper=None,
+                 on_error=None):
+        self._connect = connect
+        self.cursor_wrapper = cursor_wrapper
+        self.on_error = on_error
+        self.size = size
+        self.max_lifetime = max_lifetime
+        self.ping_interval = ping_interval
+        self.timeout = timeout
+
+        self._idle = deque()
+        self._borrowed = 0
+        self._cond = threading.Condition(threading.Lock())
+        self._pid = os.getpid()
+
+        # Метрики
+        self.borrows = 0
+        self.handshakes = 0
+        self.discarded = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def acquire(self):
+        """Выдача соединения: свободное из пула или новое, если есть место"""
+        self._check_fork()
+        start = time.monotonic()
+        deadline = start + self.timeout
+
+        while True:
+            with self._cond:
+                while not self._idle and self._borrowed >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(f"No free connection in pool after {self.timeout}s")
+                    self._cond.wait(remaining)
+
+                conn = self._idle.pop() if self._idle else None
+                self._borrowed += 1
+
+            if conn is not None and not self._is_usable(conn):
+                self._discard(conn)
+                with self._cond:
+                    self._borrowed -= 1
+                continue
+
+            if conn is None:
+                try:
+                    conn = self._new_connection()
+                except Exception:
+                    with self._cond:
+                        self._borrowed -= 1
+                        self._cond.notify()
+                    raise
+
+            waited = time.monotonic() - start
+            with self._cond:
+                self.borrows += 1
+                self.wait_time_total += waited
+                self.wait_time_max = max(self.wait_time_max, waited)
+            conn._pool = self
+            conn.suspect = False
+            return conn
+
+    def _new_connection(self):
+        raw = self._connect()
+        with self._cond:
+            self.handshakes += 1
+        return PooledConnection(self, raw, time.monotonic(), self.cursor_wrapper)
+
+    def _is_usable(self, conn):
+        """Проверка соединения при выдаче: возраст и (при простое) пинг"""
+        now = time.monotonic()
+        if now - conn.created_at > self.max_lifetime:
+            return False
+        if conn.suspect or now - conn.last_used > self.ping_interval:
+            try:
+                conn.raw.ping(reconnect=False)
+            except Exception as e:
+                logger.debug(f"Pooled connection failed health check: {e}")
+                return False
+        return True
+
+    def _release(self, conn):
+        conn.last_used = time.monotonic()
+        if os.getpid() != self._pid:
+            # Соединение унаследовано от родителя после fork — не трогаем сокет
+            return
+        with self._cond:
+            self._borrowed -= 1
+            if len(self._idle) + self._borrowed < self.size:
+                self._idle.append(conn)
+                conn = None
+            self._cond.notify()
+        if conn is not None:
+            self._discard(conn)
+
+    def _discard(self, conn):
+        with self._cond:
+            self.discarded += 1
+        try:
+            conn.raw.close()
+        except Exception:
+            pass
+
+    def _check_fork(self):
+        """После fork соединения родителя не используются: пул начинается с нуля"""
+        if os.getpid() != self._pid:
+            with self._cond:
+                self._idle.clear()
+                self._borrowed = 0
+                self._pid = os.getpid()
+
+    def prewarm(self, count):
+        """Открытие до count соединений заранее; возвращает число открытых"""
+        conns = []
+        try:
+            for _ in range(min(count, self.size)):
+                conns.append(self.acquire())
+        finally:
+            for conn in conns:
+                conn.close()
+        return len(conns)
+
+    def close_all(self):
+        """Закрытие всех свободных соединений"""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for conn in idle:
+            self._discard(conn)
+
+    def stats(self):
+        """Текущее состояние пула и накопленные метрики"""
+        with self._cond:
+            return {
+                'size': self.size,
+                'borrowed': self._borrowed,
+                'idle': len(self._idle),
+                'borrows': self.borrows,
+                'handshakes': self.handshakes,
+                'discarded': self.discarded,
+                'wait_time_total': round(self.wait_time_total, 6),
+                'wait_time_max': round(self.wait_time_max, 6),
+            }
@@ -0,0 +1,102 @@
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Replica:
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.healthy = False  # до первой проверки реплика не используется
+        self.lag = None
+        self.checked_at = None
+
+
+class DatabaseRouter:
+    """Маршрутизация соединений: запись — на primary, чтение — на реплики.
+
+    Реплика получает чтения только если последняя проверка прошла успешно и
+    её отставание не больше max_lag секунд. Пользователь после записи
+    закрепляется за primary на pin_seconds (read-your-writes). Если здоровых
+    реплик нет, чтения тоже идут на primary.
+    """
+
+    MAX_PINS = 100000
+
+    def __init__(self, primary, replicas=(), max_lag=5, pin_seconds=10):
+        self.primary = primary
+        self.replicas = [Replica(name, pool) for name, pool in replicas]
+        self.max_lag = max_lag
+        self.pin_seconds = pin_seconds
+        self._pins = {}
+        self._lock = threading.Lock()
+        self._round_robin = itertools.count()
+
+    def pin(self, user_id):
+        """Чтения пользователя идут на primary ближайшие pin_seconds"""
+        if not self.replicas:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if len(self._pins) >= self.MAX_PINS:
+                self._pins = {key: until for key, until in self._pins.items() if until > now}
+            self._pins[str(user_id)] = now + self.pin_seconds
+
+    def is_pinned(self, user_id):
+        until = self._pins.get(str(user_id))
+        return until is not None and until > time.monotonic()
+
+    def choose(self, readonly=False, user_id=None):
+        """(имя, пул) для запроса"""
+        if readonly and self.replicas and not (user_id is not None and self.is_pinned(user_id)):
+            healthy = [replica for replica in self.replicas if replica.healthy]
+            if healthy:
+                replica = healthy[next(self._round_robin) % len(healthy)]
+                return replica.name, replica.pool
+        return 'primary', self.primary
+
+    def mark_unhealthy(self, name):
+        """Реплика, на которой не удалось чтение, исключается до следующей проверки"""
+        for replica in self.replicas:
+            if replica.name == name and replica.healthy:
+                replica.healthy = False
+                logger.warning(f"Replica {name} marked unhealthy after a failed read")
+
+    def check_replicas(self):
+        """Проверка отставания реплик (SHOW REPLICA STATUS)"""
+        for replica in self.replicas:
+            try:
+                lag = self._replica_lag(replica.pool)
+            except Exception as e:
+                logger.warning(f"Replica {replica.name} health check failed: {str(e)}")
+                lag = None
+            replica.lag = lag
+            replica.checked_at = time.monotonic()
+            healthy = lag is not None and lag <= self.max_lag
+            if healthy != replica.healthy:
+                logger.warning(f"Replica {replica.name} is now {'healthy' if healthy else 'unhealthy'} (lag: {lag})")
+            replica.healthy = healthy
+
+    @staticmethod
+    def _replica_lag(pool):
+        with pool.acquire() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute('SHOW REPLICA STATUS')
+            except Exception:
+                # MySQL до 8.0.22 и MariaDB
+                cursor.execute('SHOW SLAVE STATUS')
+            status = cursor.fetchone()
+        if not status:
+            return None
+        lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+        return int(lag) if lag is not None else None
+
+    def stats(self):
+        return {
+            replica.name: {'healthy': replica.healthy, 'lag': replica.lag}
+            for replica in self.replicas
+        }
@@ -0,0 +1,35 @@
+"""Условные ответы состояния сессии (ETag / If-None-Match / 304).
+
+Общие для Flask (app.py) и ASGI (asgi_app.py): версия состояния считается
+одинаково, поэтому опрос с If-None-Match экономит тело ответа на любой
+точке входа.
+"""
+import hashlib
+
+
+def state_etag(*parts):
+    """ETag версии состояния сессии (меняется вместе с expires_at/needs_refresh)"""
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+
+
+def etag_matches(if_none_match, etag):
+    """Совпадает ли etag с одним из значений заголовка If-None-Match (слабое сравнение)"""
+    if not if_none_match:
+        return False
+    for value in if_none_match.split(','):
+        value = value.strip()
+        if value == '*':
+            return True
+        if value.startswith('W/'):
+            value = value[2:]
+        if value.strip('"') == etag:
+            return True
+    return False
+
+
+def conditional(data, etag, if_none_match):
+    """(статус, тело или None для 304, заголовки) условного ответа"""
+    headers = {'ETag': f'"{etag}"'}
+    if etag_matches(if_none_match, etag):
+        return 304, None, headers
+    return 200, data, headers
@@ -0,0 +1,12 @@
+"""Настройки gunicorn (читаются из рабочего каталога автоматически).
+
+    gunicorn app:app -w 4
+    gunicorn 'app:create_app(preload=True)' --preload -w 4
+"""
+import os
+
+
+def on_starting(server):
+    """Мастер очищает METRICS_DIR от снимков прошлого запуска — с --preload и без"""
+    from metrics import Registry
+    Registry(os.environ.get('METRICS_DIR')).clear_directory()
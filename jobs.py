@@ -0,0 +1,162 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+def try_lock(conn, cursor, name):
+    """Именованная блокировка MySQL без ожидания: задачу выполняет один воркер
+    (в SQLite один процесс на узел, блокировка не нужна)"""
+    if getattr(conn, 'dialect', 'mysql') == 'sqlite':
+        return True
+    cursor.execute('SELECT GET_LOCK(%s, 0)', (name,))
+    return cursor.fetchone()[0] == 1
+
+
+def release_lock(conn, cursor, name):
+    if getattr(conn, 'dialect', 'mysql') != 'sqlite':
+        cursor.execute('SELECT RELEASE_LOCK(%s)', (name,))
+        cursor.fetchone()
+
+
+def purge_expired_codes(get_db, batch_size=1000, max_batches=100, grace=timedelta(days=1), archive=False):
+    """Удаление (или перенос в codes_archive) просроченных кодов пачками.
+
+    Каждая пачка — отдельная короткая транзакция по списку id, чтобы не
+    держать блокировки на всей таблице. За один запуск обрабатывается не
+    больше max_batches пачек; остаток подберёт следующий запуск.
+    """
+    start = time.monotonic()
+    cutoff = (datetime.now() - grace).strftime("%Y-%m-%d %H:%M:%S")
+    rows = 0
+    batches = 0
+
+    with get_db() as conn:
+        cursor = conn.cursor()
+        # Все воркеры планируют очистку; пачки выбирает только один из них
+        if not try_lock(conn, cursor, 'purge_expired_codes'):
+            return None
+        try:
+            while batches < max_batches:
+                cursor.execute('''
+                    SELECT id FROM codes
+                    WHERE expires_at < %s
+                    ORDER BY id
+                    LIMIT %s
+                ''', (cutoff, batch_size))
+                ids = [row[0] for row in cursor.fetchall()]
+                if not ids:
+                    break
+
+                placeholders = ', '.join(['%s'] * len(ids))
+                conn.start_transaction()
+                if archive:
+                    cursor.execute(f'''
+                        INSERT INTO codes_archive
+                        SELECT * FROM codes WHERE id IN ({placeholders})
+                    ''', ids)
+                cursor.execute(f'DELETE FROM codes WHERE id IN ({placeholders})', ids)
+                conn.commit()
+
+                rows += len(ids)
+                batches += 1
+                if len(ids) < batch_size:
+                    break
+        finally:
+            release_lock(conn, cursor, 'purge_expired_codes')
+
+    stats = {'rows': rows, 'batches': batches, 'seconds': round(time.monotonic() - start, 3)}
+    logger.info(f"Expired codes {'archived' if archive else 'purged'}: {stats}")
+    return stats
+
+
+class AccessLogWriter:
+    """Буферизованная запись access_logs.
+
+    Запросы только кладут запись в буфер; в БД она попадает многострочным
+    INSERT при сбросе — по таймеру или когда буфер набрал batch_size записей
+    (сброс тогда запускается через on_full вне потока запроса). Если БД
+    недоступна, буфер ограничен max_buffer, старые записи отбрасываются.
+    """
+
+    def __init__(self, get_db, batch_size=200, max_buffer=10000, on_full=None):
+        self._get_db = get_db
+        self.batch_size = batch_size
+        self.max_buffer = max_buffer
+        self._on_full = on_full
+        self._logins = []
+        self._logouts = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+        # Статистика
+        self.rows_written = 0
+        self.dropped = 0
+        self.last_flush = None
+
+    def log_login(self, user_id, code, ip_address, user_agent, session_id, tariff=None):
+        self._append(self._logins, (
+            user_id, code, ip_address or '', user_agent,
+            datetime.now().strftime("%Y-%m-%d %H:%M:%S"), session_id, tariff
+        ))
+
+    def log_logout(self, session_id):
+        self._append(self._logouts, (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), session_id))
+
+    def _append(self, buffer, record):
+        with self._lock:
+            buffer.append(record)
+            if len(buffer) > self.max_buffer:
+                del buffer[0]
+                self.dropped += 1
+            full = len(self._logins) + len(self._logouts) == self.batch_size
+        if full and self._on_full is not None:
+            self._on_full()
+
+    def flush(self):
+        """Запись накопленного буфера в БД; возвращает статистику сброса"""
+        with self._flush_lock:
+            with self._lock:
+                logins, self._logins = self._logins, []
+                logouts, self._logouts = self._logouts, []
+            if not logins and not logouts:
+                return None
+
+            start = time.monotonic()
+            try:
+                with self._get_db() as conn:
+                    cursor = conn.cursor()
+                    for i in range(0, len(logins), self.batch_size):
+                        chunk = logins[i:i + self.batch_size]
+                        values = ', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(chunk))
+                        cursor.execute(f'''
+                            INSERT INTO access_logs
+                                (user_id, code, ip_address, user_agent, login_time, session_id, tariff)
+                            VALUES {values}
+                        ''', [value for record in chunk for value in record])
+                    if logouts:
+                        cursor.executemany('''
+                            UPDATE access_logs
+                            SET logout_time = %s
+                            WHERE session_id = %s AND logout_time IS NULL
+                        ''', logouts)
+                    conn.commit()
+            except Exception as e:
+                # Возвращаем записи в буфер, следующий сброс повторит попытку
+                logger.error(f"Access log flush error: {str(e)}")
+                with self._lock:
+                    self._logins[:0] = logins
+                    self._logouts[:0] = logouts
+                    overflow = len(self._logins) - self.max_buffer
+                    if overflow > 0:
+                        del self._logins[:overflow]
+                        self.dropped += overflow
+                return None
+
+            rows = len(logins) + len(logouts)
+            self.rows_written += rows
+            self.last_flush = {'rows': rows, 'seconds': round(time.monotonic() - start, 3)}
+            logger.info(f"Access logs flushed: {self.last_flush}")
+            return self.last_flush
@@ -0,0 +1,308 @@
+import contextvars
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+
+# Границы корзин гистограмм задержек, в секундах
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Накопители текущего HTTP-запроса (для заголовка Server-Timing)
+request_stats = contextvars.ContextVar('request_stats', default=None)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Счётчики и гистограммы с метками; вывод в текстовом формате Prometheus.
+
+    Реестр свой в каждом процессе. При нескольких воркерах gunicorn scrape
+    попадает в случайный воркер, и счётчики «прыгают» назад, поэтому с
+    directory (METRICS_DIR) каждый процесс сбрасывает снимок в
+    <directory>/<pid>-<метка запуска>.json, а render() складывает снимки всех
+    процессов: счётчики и гистограммы суммируются (включая завершившиеся
+    воркеры, чтобы суммы не убывали), gauge выводятся по живым процессам с
+    меткой pid. Метка запуска нужна, чтобы новый процесс с тем же PID не
+    затёр снимок завершившегося. Каталог очищается при старте мастера
+    gunicorn (gunicorn.conf.py, в любом режиме); под uvicorn его нужно
+    очищать в скрипте деплоя.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+        self._collectors = []
+        self._token = None
+        self._token_pid = None
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def add_collector(self, collect):
+        """collect() -> {имя метрики: значение} — снимается в момент выдачи.
+        Имена на _total — счётчики, остальные — gauge"""
+        self._collectors.append(collect)
+
+    def snapshot(self):
+        """Состояние процесса: счётчики (вместе со снятыми с коллекторов),
+        гистограммы и gauge"""
+        with self._lock:
+            counters = [[name, list(labels), value] for (name, labels), value in self._counters.items()]
+            histograms = [[name, list(labels), list(h.buckets), list(h.counts), h.sum, h.count]
+                          for (name, labels), h in self._histograms.items()]
+        gauges = {}
+        for collect in self._collectors:
+            for name, value in collect().items():
+                if name.endswith('_total'):
+                    counters.append([name, [], value])
+                else:
+                    gauges[name] = value
+        return {'counters': counters, 'histograms': histograms, 'gauges': gauges}
+
+    def dump(self):
+        """Запись снимка процесса в общий каталог (атомарно, через rename)"""
+        if not self.directory:
+            return
+        pid = os.getpid()
+        if self._token_pid != pid:
+            # Метка своя у каждого процесса, в том числе у воркера после fork
+            self._token = secrets.token_hex(4)
+            self._token_pid = pid
+        path = os.path.join(self.directory, f'{pid}-{self._token}.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path + '.tmp', path)
+
+    def _snapshots(self):
+        """(pid, снимок, процесс жив) для всех процессов из каталога"""
+        self.dump()
+        entries = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                pid = int(filename[:-5].split('-', 1)[0])
+                mtime = os.path.getmtime(path)
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            entries.append((pid, mtime, snapshot))
+
+        # PID завершившегося воркера мог достаться новому процессу:
+        # живым считается только самый свежий снимок с этим PID
+        latest = {}
+        for pid, mtime, _ in entries:
+            latest[pid] = max(latest.get(pid, mtime), mtime)
+        for pid, mtime, snapshot in entries:
+            yield pid, snapshot, mtime == latest[pid] and _is_alive(pid)
+
+    def render(self):
+        if self.directory:
+            snapshots = list(self._snapshots())
+        else:
+            snapshots = [(None, self.snapshot(), True)]
+
+        counters = {}
+        histograms = {}
+        gauges = []
+        for pid, snapshot, alive in snapshots:
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(tuple(label) for label in labels))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, buckets, counts, total, count in snapshot['histograms']:
+                key = (name, tuple(tuple(label) for label in labels))
+                merged = histograms.setdefault(key, [buckets, [0] * len(counts), 0.0, 0])
+                merged[1] = [a + b for a, b in zip(merged[1], counts)]
+                merged[2] += total
+                merged[3] += count
+            if alive:
+                labels = (('pid', str(pid)),) if pid is not None else ()
+                gauges.extend((name, labels, value) for name, value in snapshot['gauges'].items())
+
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name, 'counter')
+            lines.append(f"{name}{_labels(labels)} {value}")
+
+        for (name, labels), (buckets, counts, total, count) in sorted(histograms.items()):
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', repr(float(bound))),))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {total}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+
+        for name, labels, value in sorted(gauges):
+            header(name, 'gauge')
+            lines.append(f"{name}{_labels(labels)} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+    def clear_directory(self):
+        """Удаление снимков прошлого запуска (вызывается в мастере до fork воркеров)"""
+        if not self.directory:
+            return
+        for filename in os.listdir(self.directory):
+            if filename.endswith(('.json', '.tmp')):
+                os.remove(os.path.join(self.directory, filename))
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+registry = Registry()
+registry.describe('db_connect_seconds', 'Time to establish a new database connection')
+registry.describe('db_connect_retries_total', 'Failed database connection attempts that were retried')
+registry.describe('db_pool_wait_seconds', 'Time to obtain a pooled connection, including new handshakes')
+registry.describe('db_query_seconds', 'Query latency by statement')
+registry.describe('db_rows_total', 'Rows returned by statement')
+registry.describe('db_reads_total', 'Read-only queries by target (primary or replica)')
+registry.describe('session_stale_served_total', 'Session checks answered from last-known-good cache while the database was unavailable')
+registry.describe('http_request_seconds', 'Request latency by endpoint')
+
+
+_VERB = re.compile(r'^\s*(\w+)\s+(\w+)?')
+_TABLE = re.compile(r'\b(?:from|into)\s+(\w+)', re.IGNORECASE)
+
+
+@lru_cache(maxsize=256)
+def statement_name(sql):
+    """Короткое имя запроса для меток: 'select_codes', 'update_codes' и т.п."""
+    match = _VERB.match(sql)
+    if not match:
+        return 'other'
+    verb = match.group(1).lower()
+    if verb == 'update':
+        table = match.group(2)
+    else:
+        table_match = _TABLE.search(sql)
+        table = table_match.group(1) if table_match else None
+    return f"{verb}_{table.lower()}" if table else verb
+
+
+class InstrumentedCursor:
+    """Курсор, замеряющий время запросов и число возвращённых строк"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._statement = 'other'
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def _timed(self, method, sql, params):
+        self._statement = statement_name(sql)
+        start = time.perf_counter()
+        try:
+            return method(sql, params)
+        finally:
+            elapsed = time.perf_counter() - start
+            registry.observe('db_query_seconds', elapsed, statement=self._statement)
+            stats = request_stats.get()
+            if stats is not None:
+                stats['db'] += elapsed
+                stats['queries'] += 1
+
+    def execute(self, sql, params=()):
+        return self._timed(self._cursor.execute, sql, params)
+
+    def executemany(self, sql, seq_params):
+        return self._timed(self._cursor.executemany, sql, seq_params)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            registry.inc('db_rows_total', statement=self._statement)
+        return row
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        if rows:
+            registry.inc('db_rows_total', len(rows), statement=self._statement)
+        return rows
+
+
+def observe_request_stat(name, value):
+    """Добавление времени к накопителю текущего запроса (если он есть)"""
+    stats = request_stats.get()
+    if stats is not None:
+        stats[name] = stats.get(name, 0.0) + value
+
+
+def new_request_stats():
+    stats = {'start': time.perf_counter(), 'db': 0.0, 'queries': 0, 'connect': 0.0, 'pool_wait': 0.0}
+    request_stats.set(stats)
+    return stats
+
+
+def server_timing(stats):
+    """Значение заголовка Server-Timing для накопленных за запрос данных"""
+    total = time.perf_counter() - stats['start']
+    parts = [
+        f"db;dur={stats['db'] * 1000:.2f};desc=\"{stats['queries']} queries\"",
+        f"pool;dur={stats['pool_wait'] * 1000:.2f}",
+    ]
+    if stats['connect']:
+        parts.append(f"connect;dur={stats['connect'] * 1000:.2f}")
+    parts.append(f"total;dur={total * 1000:.2f}")
+    return ', '.join(parts)
@@ -0,0 +1,372 @@
+import logging
+import re
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Версионированные миграции схемы: (версия, описание, список DDL).
+# Применённые версии хранятся в schema_migrations; новые миграции
+# только добавляются в конец списка, старые не редактируются.
+MIGRATIONS = [
+    (1, 'initial schema', [
+        # Таблица кодов доступа
+        '''
+        CREATE TABLE IF NOT EXISTS codes (
+            id INTEGER PRIMARY KEY AUTO_INCREMENT,
+            user_id INTEGER NOT NULL,
+            code VARCHAR(255) UNIQUE NOT NULL,
+            expires_at DATETIME NOT NULL,
+            tariff VARCHAR(255),
+            is_used BOOLEAN DEFAULT FALSE,
+            session_id VARCHAR(255),
+            needs_refresh BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # Таблица логов доступа
+        '''
+        CREATE TABLE IF NOT EXISTS access_logs (
+            id INTEGER PRIMARY KEY AUTO_INCREMENT,
+            user_id INTEGER NOT NULL,
+            code VARCHAR(255) NOT NULL,
+            ip_address VARCHAR(255) NOT NULL,
+            user_agent TEXT,
+            login_time DATETIME NOT NULL,
+            logout_time DATETIME,
+            session_id VARCHAR(255)
+        )
+        ''',
+        # Архив просроченных кодов (для CODES_ARCHIVE=1)
+        '''
+        CREATE TABLE IF NOT EXISTS codes_archive LIKE codes
+        ''',
+        # Таблица пользователей (добавлена для будущего расширения)
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTO_INCREMENT,
+            telegram_id INTEGER UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (2, 'indexes for session lookups and access logs', [
+        # Проверка сессии и session_updated: покрывающий индекс, без чтения строк
+        'CREATE INDEX idx_codes_user_session ON codes (user_id, session_id, is_used, expires_at, needs_refresh)',
+        # Наблюдатель сессий выбирает по списку session_id
+        'CREATE INDEX idx_codes_session_id ON codes (session_id)',
+        # Очистка просроченных кодов
+        'CREATE INDEX idx_codes_expires_at ON codes (expires_at)',
+        'CREATE INDEX idx_access_logs_user_login ON access_logs (user_id, login_time)',
+        # Фиксация выхода по session_id
+        'CREATE INDEX idx_access_logs_session_id ON access_logs (session_id)',
+    ]),
+    (3, 'revoked sessions for JWT fast path', [
+        '''
+        CREATE TABLE IF NOT EXISTS revoked_sessions (
+            session_id VARCHAR(255) PRIMARY KEY,
+            revoked_at DATETIME NOT NULL,
+            INDEX idx_revoked_sessions_revoked_at (revoked_at)
+        )
+        ''',
+    ]),
+    (4, 'tariff index for bulk session updates', [
+        # Массовые операции по тарифу идут постранично по id внутри тарифа
+        'CREATE INDEX idx_codes_tariff ON codes (tariff)',
+    ]),
+    # Миграции 5–9 — по одному DDL: MySQL фиксирует каждый DDL сразу, и
+    # сбой на середине многошаговой версии повторял бы уже выполненные шаги
+    (5, 'daily login rollups', [
+        '''
+        CREATE TABLE IF NOT EXISTS access_log_daily (
+            day DATE NOT NULL,
+            tariff VARCHAR(255) NOT NULL DEFAULT '',
+            logins INTEGER NOT NULL,
+            unique_users INTEGER NOT NULL,
+            updated_at DATETIME NOT NULL,
+            PRIMARY KEY (day, tariff)
+        )
+        ''',
+    ]),
+    (6, 'tariff in access logs', [
+        # Тариф входа пишется в журнал: сводка по тарифам не соединяется с codes
+        'ALTER TABLE access_logs ADD COLUMN tariff VARCHAR(255) NULL',
+    ]),
+    (7, 'login time index for rollups', [
+        # Пересчёт дня в сводке: диапазон по login_time, без чтения строк
+        'CREATE INDEX idx_access_logs_login_time ON access_logs (login_time, tariff, user_id)',
+    ]),
+    (8, 'access logs primary key with login time', [
+        # Ключ партиционированной таблицы обязан содержать login_time
+        'ALTER TABLE access_logs DROP PRIMARY KEY, ADD PRIMARY KEY (id, login_time)',
+    ]),
+    (9, 'monthly partitions for access logs', [
+        # Помесячные партиции создаёт и удаляет access_stats.maintain_partitions
+        '''
+        ALTER TABLE access_logs PARTITION BY RANGE (TO_DAYS(login_time)) (
+            PARTITION p_future VALUES LESS THAN MAXVALUE
+        )
+        ''',
+    ]),
+]
+
+# Те же версии для встроенного SQLite (sqlite_store.py): другой синтаксис
+# автоинкремента, без CREATE TABLE ... LIKE и встроенных INDEX
+SQLITE_MIGRATIONS = [
+    (1, 'initial schema', [
+        '''
+        CREATE TABLE IF NOT EXISTS codes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            code VARCHAR(255) UNIQUE NOT NULL,
+            expires_at DATETIME NOT NULL,
+            tariff VARCHAR(255),
+            is_used BOOLEAN DEFAULT FALSE,
+            session_id VARCHAR(255),
+            needs_refresh BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS access_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            code VARCHAR(255) NOT NULL,
+            ip_address VARCHAR(255) NOT NULL,
+            user_agent TEXT,
+            login_time DATETIME NOT NULL,
+            logout_time DATETIME,
+            session_id VARCHAR(255)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS codes_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            code VARCHAR(255) NOT NULL,
+            expires_at DATETIME NOT NULL,
+            tariff VARCHAR(255),
+            is_used BOOLEAN DEFAULT FALSE,
+            session_id VARCHAR(255),
+            needs_refresh BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id INTEGER UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (2, 'indexes for session lookups and access logs', [
+        'CREATE INDEX idx_codes_user_session ON codes (user_id, session_id, is_used, expires_at, needs_refresh)',
+        'CREATE INDEX idx_codes_session_id ON codes (session_id)',
+        'CREATE INDEX idx_codes_expires_at ON codes (expires_at)',
+        'CREATE INDEX idx_access_logs_user_login ON access_logs (user_id, login_time)',
+        'CREATE INDEX idx_access_logs_session_id ON access_logs (session_id)',
+    ]),
+    (3, 'revoked sessions for JWT fast path', [
+        '''
+        CREATE TABLE IF NOT EXISTS revoked_sessions (
+            session_id VARCHAR(255) PRIMARY KEY,
+            revoked_at DATETIME NOT NULL
+        )
+        ''',
+        'CREATE INDEX idx_revoked_sessions_revoked_at ON revoked_sessions (revoked_at)',
+    ]),
+    (4, 'tariff index for bulk session updates', [
+        'CREATE INDEX idx_codes_tariff ON codes (tariff)',
+    ]),
+    (5, 'daily login rollups', [
+        '''
+        CREATE TABLE IF NOT EXISTS access_log_daily (
+            day DATE NOT NULL,
+            tariff VARCHAR(255) NOT NULL DEFAULT '',
+            logins INTEGER NOT NULL,
+            unique_users INTEGER NOT NULL,
+            updated_at DATETIME NOT NULL,
+            PRIMARY KEY (day, tariff)
+        )
+        ''',
+    ]),
+    (6, 'tariff in access logs', [
+        'ALTER TABLE access_logs ADD COLUMN tariff VARCHAR(255)',
+    ]),
+    (7, 'login time index for rollups', [
+        'CREATE INDEX idx_access_logs_login_time ON access_logs (login_time, tariff, user_id)',
+    ]),
+    # Партиций в SQLite нет: срок хранения соблюдается удалением строк
+    (8, 'access logs primary key with login time', []),
+    (9, 'monthly partitions for access logs', []),
+]
+
+_CREATE_INDEX = re.compile(r'^\s*CREATE INDEX (\w+) ON (\w+)', re.IGNORECASE)
+
+# Горячие запросы приложения для проверки планов через EXPLAIN
+_NOW = '2000-01-01 00:00:00'
+HOT_QUERIES = {
+    'active_session': ('''
+        SELECT expires_at FROM codes
+        WHERE user_id = %s AND session_id = %s AND is_used = 1 AND expires_at > %s
+    ''', (0, '', _NOW)),
+    'home_session': ('''
+        SELECT expires_at FROM codes
+        WHERE user_id = %s AND session_id = %s AND is_used = TRUE
+    ''', (0, '')),
+    'session_updated': ('''
+        SELECT needs_refresh, expires_at FROM codes
+        WHERE user_id = %s AND session_id = %s AND is_used = TRUE
+    ''', (0, '')),
+    'login_code': ('''
+        SELECT user_id, expires_at, tariff FROM codes
+        WHERE code = %s AND is_used = 0 AND expires_at > %s
+    ''', ('', _NOW)),
+    'watch_sessions': ('''
+        SELECT user_id, session_id, needs_refresh, expires_at FROM codes
+        WHERE session_id IN (%s) AND is_used = TRUE
+    ''', ('',)),
+    'expired_codes': ('''
+        SELECT id FROM codes
+        WHERE expires_at < %s
+        ORDER BY id
+        LIMIT 1000
+    ''', (_NOW,)),
+    'access_logs_by_user': ('''
+        SELECT login_time FROM access_logs
+        WHERE user_id = %s AND login_time >= %s
+    ''', (0, _NOW)),
+    'revoked_sessions': ('''
+        SELECT session_id, revoked_at FROM revoked_sessions
+        WHERE revoked_at >= %s
+    ''', (_NOW,)),
+    'tariff_codes': ('''
+        SELECT id, user_id, session_id FROM codes
+        WHERE tariff = %s AND id > %s
+        ORDER BY id
+        LIMIT 1000
+    ''', ('', 0)),
+    'access_logs_logout': ('''
+        SELECT id FROM access_logs
+        WHERE session_id = %s AND logout_time IS NULL
+    ''', ('',)),
+    'access_logs_rollup': ('''
+        SELECT COALESCE(tariff, ''), COUNT(*), COUNT(DISTINCT user_id) FROM access_logs
+        WHERE login_time >= %s AND login_time < %s
+        GROUP BY COALESCE(tariff, '')
+    ''', (_NOW, _NOW)),
+    'login_stats': ('''
+        SELECT day, tariff, logins, unique_users FROM access_log_daily
+        WHERE day >= %s AND day <= %s AND tariff = %s
+        ORDER BY day
+    ''', ('2000-01-01', '2000-01-01', '*')),
+}
+
+
+def migrate(conn):
+    """Применение недостающих миграций; возвращает список применённых версий.
+
+    Несколько процессов могут стартовать одновременно, поэтому миграции
+    выполняются под именованной блокировкой MySQL (в SQLite — в одной
+    транзакции BEGIN IMMEDIATE, которая и служит блокировкой).
+    """
+    sqlite = getattr(conn, 'dialect', 'mysql') == 'sqlite'
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at DATETIME NOT NULL
+        )
+    ''')
+    if sqlite:
+        conn.start_transaction()
+    else:
+        cursor.execute("SELECT GET_LOCK('schema_migrations', 60)")
+        if cursor.fetchone()[0] != 1:
+            raise RuntimeError("Could not acquire schema migration lock")
+
+    applied = []
+    try:
+        cursor.execute('SELECT version FROM schema_migrations')
+        done = {row[0] for row in cursor.fetchall()}
+
+        for version, name, statements in (SQLITE_MIGRATIONS if sqlite else MIGRATIONS):
+            if version in done:
+                continue
+            logger.info(f"Applying migration {version}: {name}")
+            for statement in statements:
+                if not sqlite and _index_exists(cursor, statement):
+                    continue
+                cursor.execute(statement)
+            cursor.execute('''
+                INSERT INTO schema_migrations (version, name, applied_at)
+                VALUES (%s, %s, %s)
+            ''', (version, name, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            if not sqlite:
+                conn.commit()
+            applied.append(version)
+        if sqlite:
+            conn.commit()
+    finally:
+        if sqlite:
+            conn.rollback()
+        else:
+            cursor.execute("SELECT RELEASE_LOCK('schema_migrations')")
+            cursor.fetchone()
+
+    return applied
+
+
+def _index_exists(cursor, statement):
+    """CREATE INDEX уже выполнен. MySQL фиксирует каждый DDL сразу, и без
+    этой проверки версия, упавшая после первого индекса, при повторе
+    падала бы на «Duplicate key name»"""
+    match = _CREATE_INDEX.match(statement)
+    if not match:
+        return False
+    cursor.execute('''
+        SELECT 1 FROM INFORMATION_SCHEMA.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+        LIMIT 1
+    ''', (match.group(2), match.group(1)))
+    return cursor.fetchone() is not None
+
+
+def explain_hot_queries(conn, min_rows=1000):
+    """EXPLAIN для каждого горячего запроса.
+
+    full_scan — MySQL читает таблицу целиком (type = ALL), и это ошибка, если
+    в таблице не меньше min_rows строк (тогда оптимизатор отказался от
+    индекса сознательно) или подходящего индекса нет вовсе. На маленькой
+    таблице оптимизатор может выбрать ALL и при наличии индекса: такой план
+    помечается unverified — проверку нужно повторить на данных объёма
+    продакшена. index_available — только подсказка (possible_keys не пуст).
+    """
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute('''
+        SELECT TABLE_NAME, TABLE_ROWS FROM INFORMATION_SCHEMA.TABLES
+        WHERE TABLE_SCHEMA = DATABASE()
+    ''')
+    table_rows = {row['TABLE_NAME']: row['TABLE_ROWS'] or 0 for row in cursor.fetchall()}
+    report = []
+    for name, (sql, params) in HOT_QUERIES.items():
+        cursor.execute('EXPLAIN ' + sql, params)
+        for row in cursor.fetchall():
+            access_type = row.get('type')
+            possible_keys = row.get('possible_keys')
+            large = table_rows.get(row.get('table'), 0) >= min_rows
+            scan = access_type == 'ALL'
+            report.append({
+                'query': name,
+                'table': row.get('table'),
+                'type': access_type,
+                'key': row.get('key'),
+                'possible_keys': possible_keys,
+                'rows': row.get('rows'),
+                'table_rows': table_rows.get(row.get('table')),
+                'full_scan': scan and (large or not possible_keys),
+                'unverified': scan and not large and bool(possible_keys),
+                'index_available': bool(possible_keys),
+            })
+    return report
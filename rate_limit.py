@@ -0,0 +1,110 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBackend:
+    """Хранилище в памяти процесса: время последнего разрешённого запроса по ключу.
+
+    Ключи упорядочены по времени обновления, поэтому устаревшие записи
+    (старше интервала — они уже ничего не ограничивают) вытесняются с начала
+    словаря; max_keys ограничивает объём сверху.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._last = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, interval, now):
+        with self._lock:
+            while self._last:
+                oldest_key, oldest_ts = next(iter(self._last.items()))
+                if now - oldest_ts < interval and len(self._last) < self.max_keys:
+                    break
+                del self._last[oldest_key]
+
+            last = self._last.get(key)
+            if last is not None and now - last < interval:
+                return False
+            self._last[key] = now
+            self._last.move_to_end(key)
+            return True
+
+
+class SQLiteBackend:
+    """Общее для всех воркеров узла хранилище в локальном файле SQLite.
+
+    Проверка и обновление выполняются одним атомарным UPSERT, поэтому лимит
+    соблюдается между процессами без отдельных блокировок.
+    """
+
+    CLEANUP_EVERY = 1000  # Раз во сколько обращений удалять устаревшие ключи
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._calls = 0
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS rate_limits (
+                    key TEXT PRIMARY KEY,
+                    ts REAL NOT NULL
+                )
+            ''')
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=OFF')
+        return conn
+
+    def _conn(self):
+        # Своё соединение на каждый поток и процесс (после fork — новое)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._local.conn = self._connect()
+            self._local.pid = os.getpid()
+        return conn
+
+    def hit(self, key, interval, now):
+        conn = self._conn()
+        cursor = conn.execute('''
+            INSERT INTO rate_limits (key, ts) VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET ts = excluded.ts
+            WHERE excluded.ts - rate_limits.ts >= ?
+        ''', (key, now, interval))
+        allowed = cursor.rowcount == 1
+
+        self._calls += 1
+        if self._calls % self.CLEANUP_EVERY == 0:
+            conn.execute('DELETE FROM rate_limits WHERE ts < ?', (now - interval,))
+        return allowed
+
+
+class RateLimiter:
+    """Не чаще одного разрешённого запроса на ключ за interval секунд"""
+
+    def __init__(self, interval, backend):
+        self.interval = interval
+        self.backend = backend
+
+    def allow(self, key):
+        try:
+            return self.backend.hit(str(key), self.interval, time.time())
+        except sqlite3.Error as e:
+            # Ограничитель не должен ронять запрос: при сбое хранилища пропускаем
+            logger.warning(f"Rate limiter backend error: {str(e)}")
+            return True
+
+
+def create_rate_limiter(interval, backend='memory', path=None):
+    """Ограничитель с хранилищем memory (на процесс) или sqlite (на узел)"""
+    if backend == 'sqlite':
+        return RateLimiter(interval, SQLiteBackend(path or 'rate_limits.sqlite3'))
+    return RateLimiter(interval, MemoryBackend())
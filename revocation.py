@@ -0,0 +1,87 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+class RevocationList:
+    """Отозванные сессии в памяти процесса для быстрой проверки JWT.
+
+    Источник — таблица revoked_sessions; refresh() подгружает записи,
+    добавленные с прошлого обновления. Отзыв важен только в пределах окна
+    revalidate-after: токен старше окна всё равно проверяется в БД, поэтому
+    записи старше retention секунд из набора удаляются.
+    """
+
+    def __init__(self, get_db, retention=300, max_staleness=30):
+        self._get_db = get_db
+        self.retention = retention
+        self.max_staleness = max_staleness
+        self._revoked = {}
+        self._lock = threading.Lock()
+        self._since = None
+        self._refreshed_at = None
+
+    def is_fresh(self):
+        """Набор обновлялся недавно — ему можно доверять вместо БД"""
+        refreshed_at = self._refreshed_at
+        return refreshed_at is not None and time.monotonic() - refreshed_at < self.max_staleness
+
+    def is_revoked(self, session_id):
+        return session_id in self._revoked
+
+    def refresh(self):
+        """Подгрузка новых отзывов из БД и удаление устаревших"""
+        now = datetime.now()
+        # Небольшой нахлёст покрывает записи с тем же временем, что и прошлый запрос
+        since = self._since - timedelta(seconds=2) if self._since else now - timedelta(seconds=self.retention)
+        with self._get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT session_id, revoked_at FROM revoked_sessions
+                WHERE revoked_at >= %s
+            ''', (since.strftime("%Y-%m-%d %H:%M:%S"),))
+            rows = cursor.fetchall()
+
+        horizon = now - timedelta(seconds=self.retention)
+        with self._lock:
+            for session_id, revoked_at in rows:
+                self._revoked[session_id] = revoked_at
+            for session_id, revoked_at in list(self._revoked.items()):
+                if revoked_at < horizon:
+                    del self._revoked[session_id]
+        self._since = now
+        self._refreshed_at = time.monotonic()
+        return len(rows)
+
+    def revoke(self, cursor, session_ids):
+        """Запись отзыва в БД (в транзакции вызывающего) и в локальный набор"""
+        if not session_ids:
+            return
+        now = datetime.now()
+        revoked_at = now.strftime("%Y-%m-%d %H:%M:%S")
+        values = ', '.join(['(%s, %s)'] * len(session_ids))
+        params = []
+        for session_id in session_ids:
+            params.extend((session_id, revoked_at))
+        cursor.execute(f'''
+            REPLACE INTO revoked_sessions (session_id, revoked_at)
+            VALUES {values}
+        ''', params)
+        with self._lock:
+            for session_id in session_ids:
+                self._revoked[session_id] = now
+
+    def prune(self):
+        """Удаление из таблицы отзывов, которые уже не влияют на токены"""
+        horizon = (datetime.now() - timedelta(seconds=self.retention)).strftime("%Y-%m-%d %H:%M:%S")
+        with self._get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM revoked_sessions WHERE revoked_at < %s', (horizon,))
+            conn.commit()
+            return cursor.rowcount
+
+    def __len__(self):
+        return len(self._revoked)
@@ -0,0 +1,132 @@
+import logging
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+ACTIONS = ('extend', 'revoke', 'refresh')
+
+
+def _shift_expires_at(conn):
+    """Выражение «expires_at + N секунд» для текущего диалекта"""
+    if getattr(conn, 'dialect', 'mysql') == 'sqlite':
+        return "datetime(expires_at, '+' || %s || ' seconds')"
+    return 'expires_at + INTERVAL %s SECOND'
+
+
+def _select_chunks(cursor, user_ids, tariff, chunk_size, only_active, now):
+    """Пачки (id, user_id, session_id) затронутых кодов: по списку user_id
+    или по тарифу (постранично по id)"""
+    condition = ' AND expires_at > %s' if only_active else ''
+    extra = (now,) if only_active else ()
+
+    if user_ids is not None:
+        for i in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[i:i + chunk_size]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f'''
+                SELECT id, user_id, session_id FROM codes
+                WHERE user_id IN ({placeholders}){condition}
+            ''', list(chunk) + list(extra))
+            rows = cursor.fetchall()
+            if rows:
+                yield rows
+        return
+
+    last_id = 0
+    while True:
+        cursor.execute(f'''
+            SELECT id, user_id, session_id FROM codes
+            WHERE tariff = %s AND id > %s{condition}
+            ORDER BY id
+            LIMIT %s
+        ''', (tariff, last_id) + extra + (chunk_size,))
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def bulk_update_sessions(get_db, action, user_ids=None, tariff=None, extend_seconds=None, expires_at=None,
+                         chunk_size=1000, include_expired=False, revocation_list=None, on_change=None):
+    """Массовое изменение сессий по списку user_id или по тарифу.
+
+    - extend: новый expires_at (или сдвиг на extend_seconds) и needs_refresh
+      для открытых сессий;
+    - revoke: срок истекает сейчас, сессии попадают в revocation_list;
+    - refresh: needs_refresh для открытых сессий.
+
+    Каждая пачка (до chunk_size пользователей или кодов) — одна короткая
+    транзакция с одним UPDATE по списку id. on_change(user_id) вызывается
+    для каждого затронутого пользователя после фиксации пачки.
+    Возвращает число затронутых кодов, сессий и пользователей.
+    """
+    if action not in ACTIONS:
+        raise ValueError(f"Unknown action: {action}")
+    if (user_ids is None) == (tariff is None):
+        raise ValueError("Exactly one of user_ids or tariff is required")
+    if action == 'extend' and (extend_seconds is None) == (expires_at is None):
+        raise ValueError("extend needs exactly one of extend_seconds or expires_at")
+
+    start = time.monotonic()
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # Отозвать или обновить можно только действующую сессию
+    only_active = action != 'extend' or not include_expired
+    stats = {'action': action, 'matched': 0, 'updated': 0, 'sessions': 0, 'users': 0, 'chunks': 0}
+    users = set()
+
+    with get_db() as conn:
+        select_cursor = conn.cursor()
+        cursor = conn.cursor()
+        for rows in _select_chunks(select_cursor, user_ids, tariff, chunk_size, only_active, now):
+            ids = [row[0] for row in rows]
+            session_ids = [row[2] for row in rows if row[2]]
+            placeholders = ', '.join(['%s'] * len(ids))
+
+            conn.start_transaction()
+            if action == 'extend':
+                if expires_at is not None:
+                    new_expires, params = '%s', [expires_at.strftime("%Y-%m-%d %H:%M:%S")]
+                else:
+                    new_expires, params = _shift_expires_at(conn), [int(extend_seconds)]
+                cursor.execute(f'''
+                    UPDATE codes
+                    SET expires_at = {new_expires},
+                        needs_refresh = CASE WHEN is_used THEN TRUE ELSE needs_refresh END
+                    WHERE id IN ({placeholders})
+                ''', params + ids)
+                updated = cursor.rowcount
+            elif action == 'revoke':
+                cursor.execute(f'''
+                    UPDATE codes
+                    SET expires_at = %s, needs_refresh = FALSE
+                    WHERE id IN ({placeholders}) AND expires_at > %s
+                ''', [now] + ids + [now])
+                # rowcount берётся до записи в revoked_sessions тем же курсором
+                updated = cursor.rowcount
+                if revocation_list is not None:
+                    revocation_list.revoke(cursor, session_ids)
+            else:
+                cursor.execute(f'''
+                    UPDATE codes
+                    SET needs_refresh = TRUE
+                    WHERE id IN ({placeholders}) AND is_used = TRUE
+                ''', ids)
+                updated = cursor.rowcount
+            conn.commit()
+
+            chunk_users = {str(row[1]) for row in rows}
+            if on_change is not None:
+                for user_id in chunk_users:
+                    on_change(user_id)
+            users.update(chunk_users)
+            stats['matched'] += len(ids)
+            stats['updated'] += updated
+            stats['sessions'] += len(session_ids)
+            stats['chunks'] += 1
+
+    stats['users'] = len(users)
+    stats['seconds'] = round(time.monotonic() - start, 3)
+    logger.info(f"Bulk session update: {stats}")
+    return stats
@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+
+class SessionCache:
+    """Кэш активных сессий в памяти процесса.
+
+    Ключ — (user_id, session_id), значение — expires_at строки codes.
+    Запись живёт не дольше ttl секунд и никогда не переживает expires_at;
+    при переполнении вытесняются давно не использованные записи (LRU).
+    Кэшируются только активные сессии: отказ всегда проверяется в БД.
+
+    stale_ttl — сколько ещё секунд после ttl запись хранится как последнее
+    подтверждённое состояние на время недоступности БД (get(allow_stale=True)).
+    """
+
+    def __init__(self, max_entries=10000, ttl=30, stale_ttl=0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()
+        self._by_user = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+
+    @staticmethod
+    def _key(user_id, session_id):
+        return str(user_id), session_id
+
+    def get(self, user_id, session_id, allow_stale=False):
+        """expires_at из кэша или None, если записи нет или она устарела"""
+        key = self._key(user_id, session_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            deadline, stale_deadline, expires_at = entry
+            if now >= stale_deadline:
+                self._remove(key)
+                self.misses += 1
+                return None
+            if now >= deadline and not allow_stale:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if now >= deadline:
+                self.stale_hits += 1
+            else:
+                self.hits += 1
+            return expires_at
+
+    def set(self, user_id, session_id, expires_at):
+        """Сохранение активной сессии с TTL, ограниченным expires_at"""
+        ttl = self.ttl
+        stale_ttl = self.ttl + self.stale_ttl
+        if isinstance(expires_at, datetime):
+            remaining = (expires_at - datetime.now()).total_seconds()
+            ttl = min(ttl, remaining)
+            stale_ttl = min(stale_ttl, remaining)
+        if ttl <= 0:
+            return
+        key = self._key(user_id, session_id)
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = (now + ttl, now + stale_ttl, expires_at)
+            self._entries.move_to_end(key)
+            self._by_user.setdefault(key[0], set()).add(session_id)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def invalidate(self, user_id, session_id=None):
+        """Сброс одной сессии или всех сессий пользователя"""
+        user_key = str(user_id)
+        with self._lock:
+            if session_id is not None:
+                self._remove((user_key, session_id))
+                return
+            for sid in list(self._by_user.get(user_key, ())):
+                self._remove((user_key, sid))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def _remove(self, key):
+        if self._entries.pop(key, None) is None:
+            return
+        sessions = self._by_user.get(key[0])
+        if sessions is not None:
+            sessions.discard(key[1])
+            if not sessions:
+                del self._by_user[key[0]]
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,131 @@
+import json
+import logging
+import queue
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Сколько session_id проверяется одним запросом
+WATCH_CHUNK_SIZE = 500
+
+
+class SessionWatcher:
+    """Один фоновый поток на процесс, который следит за подписанными сессиями.
+
+    Раз в interval секунд выбирает из codes все подписанные сессии одним
+    запросом (пачками по WATCH_CHUNK_SIZE), находит изменения needs_refresh /
+    expires_at и рассылает события подписчикам. Пока подписчиков нет, в БД
+    не ходит.
+    """
+
+    def __init__(self, get_db, interval=5, on_change=None):
+        self._get_db = get_db
+        self.interval = interval
+        self._on_change = on_change
+        self._subscribers = {}
+        self._expires = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def subscribe(self, user_id, session_id):
+        """Очередь событий для одной подписки (одной вкладки)"""
+        key = (str(user_id), session_id)
+        q = queue.Queue(maxsize=16)
+        with self._lock:
+            self._subscribers.setdefault(key, set()).add(q)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='session-watcher', daemon=True)
+                self._thread.start()
+        # Первая проверка новой подписки — сразу, без ожидания интервала
+        self._wakeup.set()
+        return q
+
+    def unsubscribe(self, user_id, session_id, q):
+        key = (str(user_id), session_id)
+        with self._lock:
+            queues = self._subscribers.get(key)
+            if queues is None:
+                return
+            queues.discard(q)
+            if not queues:
+                del self._subscribers[key]
+                self._expires.pop(key, None)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(queues) for queues in self._subscribers.values())
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.poll_once()
+            except Exception as e:
+                logger.error(f"Session watcher error: {str(e)}")
+
+    def poll_once(self):
+        """Один проход: выборка подписанных сессий и рассылка изменений"""
+        with self._lock:
+            keys = list(self._subscribers)
+        if not keys:
+            return
+
+        rows = {}
+        refreshed = []
+        with self._get_db() as conn:
+            cursor = conn.cursor(dictionary=True)
+            session_ids = [session_id for _, session_id in keys]
+            for i in range(0, len(session_ids), WATCH_CHUNK_SIZE):
+                chunk = session_ids[i:i + WATCH_CHUNK_SIZE]
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(f'''
+                    SELECT user_id, session_id, needs_refresh, expires_at FROM codes
+                    WHERE session_id IN ({placeholders}) AND is_used = TRUE
+                ''', chunk)
+                for row in cursor.fetchall():
+                    rows[(str(row['user_id']), row['session_id'])] = row
+
+            now = datetime.now()
+            for key in keys:
+                row = rows.get(key)
+                if row is None or row['expires_at'] <= now:
+                    self._publish(key, 'expired', {})
+                    continue
+
+                previous = self._expires.get(key)
+                self._expires[key] = row['expires_at']
+                if row['needs_refresh'] or (previous is not None and previous != row['expires_at']):
+                    if row['needs_refresh']:
+                        refreshed.append(key[1])
+                    self._publish(key, 'updated', {'expires_at': str(row['expires_at'])})
+
+            # Сбрасываем needs_refresh одним запросом для всех разосланных сессий
+            for i in range(0, len(refreshed), WATCH_CHUNK_SIZE):
+                chunk = refreshed[i:i + WATCH_CHUNK_SIZE]
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(f'''
+                    UPDATE codes
+                    SET needs_refresh = FALSE
+                    WHERE session_id IN ({placeholders})
+                ''', chunk)
+            if refreshed:
+                conn.commit()
+
+    def _publish(self, key, event, data):
+        if self._on_change is not None:
+            self._on_change(*key)
+        with self._lock:
+            queues = list(self._subscribers.get(key, ()))
+        for q in queues:
+            try:
+                q.put_nowait((event, data))
+            except queue.Full:
+                pass
+
+
+def format_event(event, data):
+    """Сообщение в формате Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
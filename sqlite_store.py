@@ -0,0 +1,201 @@
+"""Встроенное хранилище SQLite для узлов без собственной MySQL.
+
+    DB_BACKEND=sqlite SQLITE_PATH=/var/lib/app/access_data.sqlite3
+
+Соединения повторяют интерфейс mysql.connector, который использует
+приложение: cursor(dictionary=...), плейсхолдеры %s, start_transaction,
+commit/rollback, ping. Ошибки SQLite переводятся в исключения
+mysql.connector, поэтому обработка ошибок в приложении не меняется.
+Схема создаётся теми же миграциями (SQLite-вариант DDL в migrations.py),
+коды подгружаются из MySQL через sync_from_mysql (flask sync-sqlite).
+"""
+import logging
+import re
+import sqlite3
+import time
+from datetime import datetime
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Значения DATETIME/TIMESTAMP возвращаются как datetime, как у MySQL
+sqlite3.register_converter('DATETIME', lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',  # читатели не блокируют писателя и друг друга
+    'PRAGMA synchronous=NORMAL',  # в WAL-режиме безопасно и без fsync на каждый коммит
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA cache_size=-16000',  # 16 МБ страничного кэша на соединение
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA mmap_size=134217728',
+    'PRAGMA foreign_keys=ON',
+)
+# Сколько скомпилированных запросов держит каждое соединение
+STATEMENT_CACHE_SIZE = 256
+
+_PLACEHOLDER = re.compile(r'%s')
+
+
+@lru_cache(maxsize=512)
+def translate(sql):
+    """Плейсхолдеры MySQL (%s) -> SQLite (?); один и тот же текст даёт один
+    и тот же оператор, поэтому он берётся из кэша подготовленных запросов"""
+    return _PLACEHOLDER.sub('?', sql)
+
+
+def _translate_error(e):
+    import mysql.connector
+    if isinstance(e, sqlite3.IntegrityError):
+        return mysql.connector.IntegrityError(msg=str(e))
+    if isinstance(e, sqlite3.OperationalError):
+        return mysql.connector.OperationalError(msg=str(e))
+    return mysql.connector.DatabaseError(msg=str(e))
+
+
+class SQLiteCursor:
+    def __init__(self, conn, dictionary=False):
+        self._conn = conn
+        self._cursor = conn._sqlite.cursor()
+        self._dictionary = dictionary
+
+    def execute(self, sql, params=()):
+        try:
+            self._cursor.execute(translate(sql), tuple(params or ()))
+        except sqlite3.Error as e:
+            raise _translate_error(e) from e
+
+    def executemany(self, sql, seq_params):
+        try:
+            self._cursor.executemany(translate(sql), [tuple(p) for p in seq_params])
+        except sqlite3.Error as e:
+            raise _translate_error(e) from e
+
+    def _convert(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return {column[0]: value for column, value in zip(self._cursor.description, row)}
+
+    def fetchone(self):
+        return self._convert(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._convert(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """Соединение SQLite с интерфейсом mysql.connector"""
+
+    dialect = 'sqlite'
+
+    def __init__(self, path):
+        self._sqlite = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False,
+                                       detect_types=sqlite3.PARSE_DECLTYPES,
+                                       cached_statements=STATEMENT_CACHE_SIZE)
+        for pragma in PRAGMAS:
+            self._sqlite.execute(pragma)
+        self.autocommit = True
+
+    def cursor(self, dictionary=False, **kwargs):
+        return SQLiteCursor(self, dictionary=dictionary)
+
+    def start_transaction(self):
+        # IMMEDIATE: блокировка записи берётся сразу, а не при первом UPDATE
+        self._sqlite.execute('BEGIN IMMEDIATE')
+
+    def commit(self):
+        if self._sqlite.in_transaction:
+            self._sqlite.execute('COMMIT')
+
+    def rollback(self):
+        if self._sqlite.in_transaction:
+            self._sqlite.execute('ROLLBACK')
+
+    def ping(self, reconnect=False):
+        try:
+            self._sqlite.execute('SELECT 1')
+        except sqlite3.Error as e:
+            raise _translate_error(e) from e
+
+    def close(self):
+        self._sqlite.close()
+
+
+def connect(path):
+    return SQLiteConnection(path)
+
+
+def sync_from_mysql(source, target, batch_size=5000):
+    """Загрузка codes и users из MySQL в SQLite (постранично по id).
+
+    Новые коды добавляются; у существующих обновляются срок и тариф
+    (продление в центральной базе помечает сессию needs_refresh), а код,
+    использованный в другом месте, помечается использованным. Локальные
+    входы (session_id) не перетираются. Возвращает статистику загрузки.
+    """
+    start = time.monotonic()
+    stats = {'codes': 0, 'users': 0}
+    src = source.cursor()
+    dst = target.cursor()
+
+    last_id = 0
+    while True:
+        src.execute('''
+            SELECT id, user_id, code, expires_at, tariff, is_used, created_at FROM codes
+            WHERE id > %s
+            ORDER BY id
+            LIMIT %s
+        ''', (last_id, batch_size))
+        rows = src.fetchall()
+        if not rows:
+            break
+        target.start_transaction()
+        dst.executemany('''
+            INSERT INTO codes (user_id, code, expires_at, tariff, is_used, created_at)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON CONFLICT (code) DO UPDATE SET
+                needs_refresh = CASE WHEN codes.expires_at != excluded.expires_at
+                                     THEN 1 ELSE codes.needs_refresh END,
+                expires_at = excluded.expires_at,
+                tariff = excluded.tariff,
+                is_used = MAX(codes.is_used, excluded.is_used)
+        ''', [(user_id, code, _format(expires_at), tariff, int(bool(is_used)), _format(created_at))
+              for _, user_id, code, expires_at, tariff, is_used, created_at in rows])
+        target.commit()
+        stats['codes'] += len(rows)
+        last_id = rows[-1][0]
+
+    src.execute('SELECT id, telegram_id, created_at FROM users ORDER BY id')
+    users = src.fetchall()
+    if users:
+        target.start_transaction()
+        dst.executemany('''
+            INSERT OR REPLACE INTO users (id, telegram_id, created_at)
+            VALUES (%s, %s, %s)
+        ''', [(user_id, telegram_id, _format(created_at)) for user_id, telegram_id, created_at in users])
+        target.commit()
+    stats['users'] = len(users)
+
+    stats['seconds'] = round(time.monotonic() - start, 3)
+    logger.info(f"SQLite sync from MySQL: {stats}")
+    return stats
+
+
+def _format(value):
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return value
@@ -852,39 +852,160 @@ document.addEventListener('DOMContentLoaded', () => {
     }
   });
 
-  // Функция для проверки обновления сессии
-  async function checkSessionUpdate() {
+  // Единое наблюдение за сессией на все вкладки: одна вкладка-лидер (Web Locks)
+  // держит SSE-подписку или, если она недоступна, опрашивает сервер условными
+  // запросами (If-None-Match) с нарастающим интервалом. Остальные вкладки
+  // получают события через BroadcastChannel.
+  const SESSION_POLL_MIN = 15000;
+  const SESSION_POLL_MAX = 300000;
+  const sessionChannel = 'BroadcastChannel' in window ? new BroadcastChannel('session-state') : null;
+
+  function applySessionEvent(type, payload) {
+    if (type === 'updated') {
+      const sessionData = localStorage.getItem('session_data');
+      if (sessionData) {
+        // Обновляем данные сессии в localStorage
+        const data = JSON.parse(sessionData);
+        data.expires_at = payload.expires_at;
+        localStorage.setItem('session_data', JSON.stringify(data));
+      }
+      // Перезагружаем страницу для применения изменений
+      window.location.reload();
+    }
+    else if (type === 'expired') {
+      localStorage.removeItem('session_data');
+      localStorage.removeItem('jwt_token');
+      localStorage.removeItem('expires_at');
+      window.location.href = '/login?no_redirect=1';
+    }
+  }
+
+  function publishSessionEvent(type, payload) {
+    if (sessionChannel) {
+      sessionChannel.postMessage({ type, payload });
+    }
+    applySessionEvent(type, payload);
+  }
+
+  if (sessionChannel) {
+    sessionChannel.onmessage = (event) => applySessionEvent(event.data.type, event.data.payload);
+  }
+
+  // Условный запрос: 304 означает, что состояние не изменилось.
+  // changed — сервер вернул новую версию состояния (другой ETag)
+  async function fetchSessionState(url, options, etags) {
+    const previous = etags[url];
+    const headers = Object.assign({}, options.headers);
+    if (previous) {
+      headers['If-None-Match'] = previous;
+    }
+    const response = await fetch(url, Object.assign({}, options, { headers, cache: 'no-store' }));
+    if (response.status === 304) {
+      return { changed: false, response };
+    }
+    const etag = response.headers.get('ETag');
+    if (etag) {
+      etags[url] = etag;
+    }
+    return { changed: Boolean(previous && etag && etag !== previous), response };
+  }
+
+  // Один цикл опроса; возвращает true, если состояние сессии изменилось
+  async function pollSessionState(data, etags) {
+    const check = await fetchSessionState('/api/check_session', {
+      headers: {
+        'X-Session-Id': data.session_id,
+        'X-User-Id': data.user_id
+      }
+    }, etags);
+    if (check.response.status === 401) {
+      publishSessionEvent('expired', {});
+      return true;
+    }
+
+    const update = await fetchSessionState('/api/session_updated', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json'
+      },
+      body: JSON.stringify({
+        user_id: data.user_id,
+        session_id: data.session_id
+      })
+    }, etags);
+    if (update.response.status === 200) {
+      const result = await update.response.json();
+      if (result.status === 'updated') {
+        publishSessionEvent('updated', { expires_at: result.expires_at });
+        return true;
+      }
+    }
+    return check.changed || update.changed;
+  }
+
+  // Опрос с адаптивным интервалом: без изменений интервал удваивается
+  function runSessionPoller(data) {
+    const etags = {};
+    let delay = SESSION_POLL_MIN;
+
+    const tick = async () => {
+      try {
+        const changed = await pollSessionState(data, etags);
+        delay = changed ? SESSION_POLL_MIN : Math.min(delay * 2, SESSION_POLL_MAX);
+      } catch (error) {
+        console.error('Failed to check session state:', error);
+        delay = Math.min(delay * 2, SESSION_POLL_MAX);
+      }
+      setTimeout(tick, delay);
+    };
+    tick();
+  }
+
+  // Подписка на события сессии (server push), если сервер её включил; иначе опрос
+  function watchSession(data) {
+    if (document.body.dataset.sse !== '1' || !('EventSource' in window)) {
+      runSessionPoller(data);
+      return;
+    }
+
+    const params = new URLSearchParams({
+      user_id: data.user_id,
+      session_id: data.session_id
+    });
+    const source = new EventSource(`/api/session_events?${params}`);
+
+    source.addEventListener('updated', (event) => {
+      publishSessionEvent('updated', JSON.parse(event.data));
+    });
+
+    source.addEventListener('expired', () => {
+      source.close();
+      publishSessionEvent('expired', {});
+    });
+
+    source.addEventListener('error', () => {
+      // Браузер сам переподключается; CLOSED означает, что SSE недоступен
+      if (source.readyState === EventSource.CLOSED) {
+        runSessionPoller(data);
+      }
+    });
+  }
+
+  function startSessionWatch() {
     const sessionData = localStorage.getItem('session_data');
     if (!sessionData) return;
-
     const data = JSON.parse(sessionData);
-    try {
-      const response = await fetch('/api/session_updated', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json'
-        },
-        body: JSON.stringify({
-          user_id: data.user_id,
-          session_id: data.session_id
-        })
-      });
 
-      if (response.ok) {
-        const result = await response.json();
-        if (result.status === 'updated') {
-          // Обновляем данные сессии в localStorage
-          data.expires_at = result.expires_at;
-          localStorage.setItem('session_data', JSON.stringify(data));
-          // Перезагружаем страницу для применения изменений
-          window.location.reload();
-        }
-      }
-    } catch (error) {
-      console.error('Failed to check session update:', error);
+    if (navigator.locks) {
+      // Блокировка держится, пока вкладка открыта; затем её берёт следующая
+      navigator.locks.request('session-watch', () => {
+        watchSession(data);
+        return new Promise(() => {});
+      });
+    } else {
+      watchSession(data);
     }
   }
 
-  // Добавляем периодическую проверку обновления сессии
-  setInterval(checkSessionUpdate, 5000);
+  startSessionWatch();
 });
\ No newline at end of file
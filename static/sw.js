@@ -108,14 +108,14 @@ async function checkSessionExpiration() {
   }
 }
 
-// Добавляем периодическую проверку сессии
-setInterval(checkSessionExpiration, 10000);
+// Периодическую проверку сессии ведёт единый наблюдатель на странице
+// (script.js), сервис-воркер проверяет сессию только при навигации
 
 self.addEventListener('fetch', (event) => {
   const url = new URL(event.request.url);
   
-  // Пропускаем запросы к статическим файлам и логину
-  if (url.pathname.startsWith('/static/') || url.pathname === '/login') {
+  // Статика (в том числе хэшированная из /assets/) и логин — сначала из кэша
+  if (url.pathname.startsWith('/static/') || url.pathname.startsWith('/assets/') || url.pathname === '/login') {
     event.respondWith(
       caches.match(event.request)
         .then(response => response || fetch(event.request))